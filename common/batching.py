@@ -0,0 +1,90 @@
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of (BERT wordpiece) tokens of a text without loading a tokenizer.
+
+    Words split into about 4 wordpieces for 3 words on average, plus the [CLS] and [SEP] tokens.
+    """
+    return len(text.split()) * 4 // 3 + 2
+
+
+def plan_batches(lengths: List[int], max_batch_tokens: int, max_batch_size: int = None) -> List[List[int]]:
+    """
+    Group texts by similar length into batches whose padded size fits in a token budget.
+
+    The texts are sorted by length and batches are cut greedily, so each text is padded to a
+    close length. A batch costs its size times its longest text (every text is padded to it).
+    A text longer than the budget gets a batch of its own.
+
+    Args:
+        lengths: Token length of each text
+        max_batch_tokens: Maximum padded tokens of a batch
+        max_batch_size: Optional maximum number of texts of a batch
+
+    Returns:
+        The batches, as lists of indices into `lengths`
+    """
+    batches = []
+    current = []
+    for idx in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Sorted by length, so this text is the longest of the batch once added
+        padded_tokens = (len(current) + 1) * lengths[idx]
+        if current and (padded_tokens > max_batch_tokens
+                        or (max_batch_size is not None and len(current) >= max_batch_size)):
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def scan_bucketed(texts: List[str], scan: Callable[[str], Any], scan_batch: Optional[Callable[[List[str]], List[Any]]],
+                  count_tokens: Callable[[str], int], max_batch_tokens: int,
+                  max_batch_size: int = None) -> Tuple[List[Any], List[float], int, Optional[int]]:
+    """
+    Scan texts by length-bucketed batches, returning the outputs in the original order.
+
+    Args:
+        texts: The texts to scan
+        scan: Function scanning one text, used when no batch function is given
+        scan_batch: Optional function scanning a list of texts, returning one output per text
+        count_tokens: Function returning the token length of a text
+        max_batch_tokens: Maximum padded tokens of a batch
+        max_batch_size: Optional maximum number of texts of a batch
+
+    Returns:
+        The outputs and per-text latencies (batch duration shared evenly, each scan timed alone
+        without `scan_batch`), in the order of `texts`,
+        and the real and padded token counts of the batches (padded tokens being None without
+        `scan_batch`: the texts are then only ordered by length and scanned one at a time, unpadded)
+    """
+    lengths = [count_tokens(text) for text in texts]
+    outputs = [None] * len(texts)
+    latencies = [0.0] * len(texts)
+    tokens = 0
+    padded_tokens = 0 if scan_batch is not None else None
+
+    for batch in plan_batches(lengths, max_batch_tokens, max_batch_size):
+        if scan_batch is not None:
+            scan_start = time.perf_counter()
+            batch_outputs = scan_batch([texts[idx] for idx in batch])
+            # Batched texts share the batch duration evenly
+            latency = (time.perf_counter() - scan_start) / len(batch)
+            for idx, output in zip(batch, batch_outputs):
+                outputs[idx] = output
+                latencies[idx] = latency
+        else:
+            # Texts scanned one at a time keep their own latency
+            for idx in batch:
+                scan_start = time.perf_counter()
+                outputs[idx] = scan(texts[idx])
+                latencies[idx] = time.perf_counter() - scan_start
+        tokens += sum(lengths[idx] for idx in batch)
+        if scan_batch is not None:
+            padded_tokens += len(batch) * max(lengths[idx] for idx in batch)
+
+    return outputs, latencies, tokens, padded_tokens
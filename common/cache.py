@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Optional, Tuple
+
+
+class PredictionCache:
+    """
+    Content-addressed on-disk cache of scanner predictions, stored in a local SQLite file.
+    
+    Entries are keyed by the tool, the scanner configuration and the scanned text, so a
+    prediction is reused only when the exact same scanner would see the exact same text.
+    Once the stored values exceed `max_size_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = ".cache/predictions.sqlite", max_size_bytes: int = 1024 ** 3):
+        """
+        Initialize the PredictionCache class.
+        
+        :param path: Path of the SQLite file
+        :param max_size_bytes: Maximum total size of the cached values
+        """
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._size_bytes = 0
+
+    def __getstate__(self):
+        # SQLite connections can't be shared across processes, each worker reopens the file
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS predictions_last_access ON predictions(last_access)")
+            self._size_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM predictions").fetchone()[0]
+        return self._connection
+
+    @staticmethod
+    def namespace(tool: str, config: dict) -> str:
+        """
+        Build the key prefix of a scanner configuration.
+        
+        :param tool: Name of the evaluated tool (e.g. llmguard_pii)
+        :param config: Everything that changes the scanner output (model, threshold, entities...)
+        :return: Digest identifying the tool and its configuration
+        """
+        serialized = json.dumps([tool, config], sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Look up a cached prediction.
+        
+        :param key: Key built with `PredictionCache.key`
+        :return: (found, value) tuple
+        """
+        row = self.connection.execute("SELECT value FROM predictions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        
+        self.hits += 1
+        self.connection.execute("UPDATE predictions SET last_access = ? WHERE key = ?", (time.time(), key))
+        return True, json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        """
+        Store a JSON serializable prediction, evicting old entries if the cache is full.
+        
+        :param key: Key built with `PredictionCache.key`
+        :param value: The prediction to store
+        """
+        serialized = json.dumps(value)
+        size = len(serialized)
+        
+        previous = self.connection.execute("SELECT size FROM predictions WHERE key = ?", (key,)).fetchone()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO predictions (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, serialized, size, time.time())
+        )
+        self._size_bytes += size - (previous[0] if previous else 0)
+        
+        if self._size_bytes > self.max_size_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Delete the least recently used entries until the cache is back to 90% of its maximum size"""
+        target_size = int(self.max_size_bytes * 0.9)
+        freed = 0
+        rows = self.connection.execute("SELECT key, size FROM predictions ORDER BY last_access")
+        evicted_keys = []
+        for key, size in rows:
+            if self._size_bytes - freed <= target_size:
+                break
+            evicted_keys.append((key,))
+            freed += size
+        
+        self.connection.executemany("DELETE FROM predictions WHERE key = ?", evicted_keys)
+        self._size_bytes -= freed
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def cached_scan(cache: Optional[PredictionCache], namespace: str, text: str, scan: Callable[[], Any]) -> Tuple[Any, bool]:
+    """
+    Run a scan through the prediction cache.
+    
+    :param cache: The prediction cache, or None to always scan
+    :param namespace: Namespace built with `PredictionCache.namespace`
+    :param text: The scanned text
+    :param scan: Function running the scanner on the text, returning a JSON serializable value
+    :return: (prediction, from_cache) tuple
+    """
+    if cache is None:
+        return scan(), False
+    
+    key = PredictionCache.key(namespace, text)
+    found, value = cache.get(key)
+    if found:
+        return value, True
+    
+    value = scan()
+    cache.set(key, value)
+    return value, False
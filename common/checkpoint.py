@@ -0,0 +1,174 @@
+import copy
+import os
+import pickle
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.metrics import EvaluationMetrics
+
+# Rows between two checkpoints when checkpointing is enabled by resume alone
+DEFAULT_CHECKPOINT_EVERY = 1000
+
+
+class Checkpoint:
+    """
+    Periodic on-disk checkpoint of an evaluation: the position of the next row to score
+    and the partial EvaluationMetrics, so an interrupted run can resume where it stopped.
+
+    Without max_details, the details lists of the metrics grow with the run: instead of being
+    pickled again at every checkpoint, the details added since the previous one are appended to
+    a `<path>.details` log. The log and the spill files are truncated back to their checkpointed
+    size on resume, so the rows scored again don't duplicate their details.
+    """
+
+    def __init__(self, path: str, every: int = 1000, resume: bool = False, fingerprint: Any = None):
+        """
+        Initialize the Checkpoint class.
+        
+        :param path: Path of the checkpoint file
+        :param every: Number of rows between two checkpoints
+        :param resume: Whether to restore the existing checkpoint instead of starting over
+        :param fingerprint: Optional description of the run (dataset, sizes, options...), a
+            checkpoint is only restored by a run with the same fingerprint
+        """
+        if every < 1:
+            raise ValueError(f"Invalid checkpoint interval: {every}")
+        self.path = path
+        self.every = every
+        self.resume = resume
+        self.fingerprint = fingerprint
+        self._last_position = 0
+        # Size of the details log and number of details it holds per category, as of the last checkpoint
+        self._details_offset = 0
+        self._logged_details: Dict[str, int] = {}
+
+    def for_shard(self, index: int, num_shards: int) -> "Checkpoint":
+        """Return the checkpoint of one shard of a sharded evaluation"""
+        root, ext = os.path.splitext(self.path)
+        return Checkpoint(
+            f"{root}.shard{index}of{num_shards}{ext}",
+            every=self.every,
+            resume=self.resume,
+            fingerprint=(self.fingerprint, index, num_shards)
+        )
+
+    def restore(self) -> Optional[Tuple[int, EvaluationMetrics, bool]]:
+        """
+        Load the checkpoint if resuming and one exists.
+        
+        :return: (position, metrics, finished) tuple, or None to start from the first row
+        """
+        if not self.resume or not os.path.exists(self.path):
+            return None
+        
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        
+        if state["fingerprint"] != self.fingerprint:
+            raise ValueError(f"Checkpoint {self.path} was saved by a different run, remove it or disable resume")
+        
+        # Don't count the time the run was stopped in the evaluation duration
+        metrics: EvaluationMetrics = state["metrics"]
+        metrics.start_date += datetime.now() - state["saved_at"]
+
+        # Drop the details written after the checkpoint, their rows are scored again
+        for path, size in state.get("spill_sizes", {}).items():
+            if os.path.exists(path):
+                os.truncate(path, size)
+        if state.get("details_offset") is not None:
+            self._details_offset = state["details_offset"]
+            self._restore_details(metrics)
+        
+        self._last_position = state["position"]
+        print(f"Resuming from checkpoint {self.path} at row {state['position']}")
+        return state["position"], metrics, state["finished"]
+
+    def update(self, position: int, metrics: EvaluationMetrics):
+        """
+        Save a checkpoint if enough rows were scored since the last one.
+        
+        :param position: Number of rows already scored
+        :param metrics: The partial metrics
+        """
+        if position - self._last_position >= self.every:
+            self.save(position, metrics)
+
+    def save(self, position: int, metrics: EvaluationMetrics, finished: bool = False):
+        """
+        Atomically write the checkpoint file.
+        
+        :param position: Number of rows already scored
+        :param metrics: The (partial) metrics
+        :param finished: Whether the evaluation is complete
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Shallow copy, pickling flushes the spill file so its size is final
+        metrics_state = copy.copy(metrics)
+        details_offset = None
+        if metrics.max_details is None:
+            details_offset = self._log_details(metrics)
+            metrics_state.errors = {stat_type: [] for stat_type in metrics.errors}
+            metrics_state.scan_errors = []
+
+        spill_paths = list(metrics.spill_files)
+        if metrics.spill_path() is not None and metrics.spill_path() not in spill_paths:
+            # Not created yet, it would be by details spilled after this checkpoint
+            spill_paths.append(metrics.spill_path())
+        state = {
+            "fingerprint": self.fingerprint,
+            "position": position,
+            "finished": finished,
+            "saved_at": datetime.now(),
+            "metrics": metrics_state,
+            "details_offset": details_offset,
+            "spill_sizes": {path: os.path.getsize(path) if os.path.exists(path) else 0 for path in spill_paths}
+        }
+        
+        # Write to a temporary file first so a crash never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, self.path)
+        self._last_position = position
+
+    @staticmethod
+    def _details_lists(metrics: EvaluationMetrics) -> Dict[str, List[Any]]:
+        return {**metrics.errors, "scan_errors": metrics.scan_errors}
+
+    def _log_details(self, metrics: EvaluationMetrics) -> int:
+        """Append the details added since the last checkpoint to the details log, returning its new size"""
+        with open(f"{self.path}.details", "ab") as f:
+            # Anything past the last checkpoint was never referenced by one (new run, or crash before the rename)
+            f.truncate(self._details_offset)
+            for stat_type, details_list in self._details_lists(metrics).items():
+                for details in details_list[self._logged_details.get(stat_type, 0):]:
+                    pickle.dump((stat_type, details), f)
+                self._logged_details[stat_type] = len(details_list)
+            f.flush()
+            os.fsync(f.fileno())
+            self._details_offset = f.tell()
+        return self._details_offset
+
+    def _restore_details(self, metrics: EvaluationMetrics):
+        """Read the details of the checkpoint back from the details log"""
+        details_path = f"{self.path}.details"
+        details_lists = self._details_lists(metrics)
+        if os.path.exists(details_path):
+            os.truncate(details_path, self._details_offset)
+            with open(details_path, "rb") as f:
+                while f.tell() < self._details_offset:
+                    stat_type, details = pickle.load(f)
+                    details_lists[stat_type].append(details)
+        self._logged_details = {stat_type: len(details_list) for stat_type, details_list in details_lists.items()}
+
+
+def restore_checkpoint(checkpoint: Optional[Checkpoint], metrics: EvaluationMetrics) -> Tuple[int, EvaluationMetrics, bool]:
+    """
+    Restore the state of an interrupted evaluation, if any.
+    
+    :param checkpoint: The checkpoint of the evaluation, or None
+    :param metrics: The fresh metrics, returned when there is nothing to restore
+    :return: (position, metrics, finished) tuple
+    """
+    restored = checkpoint.restore() if checkpoint is not None else None
+    return restored if restored is not None else (0, metrics, False)
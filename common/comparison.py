@@ -0,0 +1,222 @@
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from common.metrics import EvaluationMetrics
+
+# Detection metrics and latency metrics compared between variants
+DETECTION_METRICS = ["accuracy", "precision", "recall", "f1_score"]
+LATENCY_METRICS = ["p50", "p99", "scan_throughput", "model_memory_mb", "model_weights_mb", "resident_memory_mb"]
+
+
+class MetricsComparison:
+    def __init__(self, label: str, variants: Dict[str, EvaluationMetrics], baseline: str = None,
+                 texts: List[str] = None):
+        """
+        Initialize the MetricsComparison class, comparing evaluations of the same dataset side by side.
+
+        :param label: Label of the comparison
+        :param variants: Metrics of each variant (e.g. backend), by variant name
+        :param baseline: Name of the variant the others are compared to (defaults to the first one)
+        :param texts: Optional evaluated texts in dataset order, included in the exported flipped predictions
+        """
+        self.label = label
+        self.variants = variants
+        self.baseline = baseline or next(iter(variants))
+        self.texts = texts
+
+    def calculate_comparison(self):
+        """
+        Calculate the detection and latency metrics of each variant, and their deltas to the baseline.
+
+        :return: Dictionary of metrics and deltas (variant minus baseline) by variant name
+        """
+        values = {}
+        for name, metrics in self.variants.items():
+            detection_metrics = metrics.calculate_metrics()
+            latency_metrics = metrics.calculate_latency_metrics()
+            values[name] = {
+                **{key: detection_metrics.get(key, 0) for key in DETECTION_METRICS},
+                **{key: latency_metrics.get(key, 0) for key in LATENCY_METRICS}
+            }
+
+        baseline_values = values[self.baseline]
+        return {
+            name: {
+                "metrics": variant_values,
+                "deltas": {key: value - baseline_values[key] for key, value in variant_values.items()}
+            }
+            for name, variant_values in values.items()
+        }
+
+    def find_flipped_predictions(self):
+        """
+        Find the rows whose prediction differs between the baseline and another variant.
+
+        Predictions are compared by position, so the variants must have evaluated the same rows
+        in the same order (predictions are recorded by the PII, toxicity and jailbreak evaluators).
+
+        :return: One record per flipped row and variant, with the ground truth and both predictions
+        """
+        baseline_metrics = self.variants[self.baseline]
+        flips = []
+        for name, metrics in self.variants.items():
+            if name == self.baseline:
+                continue
+            if len(metrics.predictions) != len(baseline_metrics.predictions):
+                raise ValueError(f"Variant '{name}' evaluated {len(metrics.predictions)} rows, "
+                                 f"'{self.baseline}' evaluated {len(baseline_metrics.predictions)}")
+            for idx, (baseline_prediction, prediction) in enumerate(zip(baseline_metrics.predictions, metrics.predictions)):
+                if baseline_prediction == prediction:
+                    continue
+                flips.append({
+                    "index": idx,
+                    "variant": name,
+                    "text": self.texts[idx] if self.texts is not None else None,
+                    "ground_truth": bool(baseline_metrics.prediction_labels[idx]),
+                    self.baseline: bool(baseline_prediction),
+                    name: bool(prediction)
+                })
+        return flips
+
+    def calculate_agreement(self):
+        """
+        Calculate the pairwise agreement of the variants, the share of rows they predicted the same way.
+
+        Like flipped predictions, this requires variants that evaluated the same rows in the same order.
+
+        :return: Agreement matrix, as a dictionary of agreement ratios by variant name and other variant name
+        """
+        names = list(self.variants)
+        lengths = {len(metrics.predictions) for metrics in self.variants.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Variants evaluated different numbers of rows: {sorted(lengths)}")
+
+        predictions = {name: np.frombuffer(metrics.predictions, dtype=np.int8) for name, metrics in self.variants.items()}
+        return {
+            name: {
+                other: float(np.mean(predictions[name] == predictions[other])) if len(predictions[name]) > 0 else 0
+                for other in names
+            }
+            for name in names
+        }
+
+    def _format_comparison(self):
+        """Format the comparison as report lines"""
+        comparison = self.calculate_comparison()
+        lines = [
+            f"Baseline: {self.baseline}",
+            "Variant           Accuracy  Precision  Recall  F1 Score  p50 (ms)  p99 (ms)  Throughput (samples/s)"
+            "  Model memory (MB)  Weights (MB)"
+        ]
+        for name, values in comparison.items():
+            m = values["metrics"]
+            lines.append(f"{name:<16}  {m['accuracy']:<8.4f}  {m['precision']:<9.4f}  {m['recall']:<6.4f}  "
+                         f"{m['f1_score']:<8.4f}  {m['p50'] * 1000:<8.2f}  {m['p99'] * 1000:<8.2f}  "
+                         f"{m['scan_throughput']:<22.2f}  {m['model_memory_mb']:<17.1f}  {m['model_weights_mb']:.1f}")
+        for name, values in comparison.items():
+            if name == self.baseline:
+                continue
+            d = values["deltas"]
+            lines.append(f"{name} vs {self.baseline}: accuracy {d['accuracy']:+.4f}, F1 {d['f1_score']:+.4f}, "
+                         f"p50 {d['p50'] * 1000:+.2f} ms, p99 {d['p99'] * 1000:+.2f} ms, "
+                         f"throughput {d['scan_throughput']:+.2f} samples/s, "
+                         f"model memory {d['model_memory_mb']:+.1f} MB, weights {d['model_weights_mb']:+.1f} MB")
+        if any(len(metrics.predictions) > 0 for metrics in self.variants.values()):
+            lines.append(f"Flipped predictions: {len(self.find_flipped_predictions())}")
+            agreement = self.calculate_agreement()
+            width = max(16, *(len(name) for name in agreement))
+            lines.append("Row agreement".ljust(width) + "  " + "  ".join(f"{name:>{width}}" for name in agreement))
+            for name, row in agreement.items():
+                lines.append(f"{name:<{width}}  " + "  ".join(f"{ratio:>{width}.2%}" for ratio in row.values()))
+        return lines
+
+    def plot_comparison(self):
+        """Create side by side bar charts of the F1 score and latency percentiles of each variant"""
+        import matplotlib.pyplot as plt
+
+        comparison = self.calculate_comparison()
+        names = list(comparison)
+        x = np.arange(len(names))
+        fig, (f1_ax, latency_ax) = plt.subplots(1, 2, figsize=(14, 6))
+
+        f1_ax.bar(x, [comparison[name]["metrics"]["f1_score"] for name in names], color='#2196F3')
+        f1_ax.set_xticks(x, names)
+        f1_ax.set_ylim(0, 1.1)
+        f1_ax.set_ylabel('F1 Score')
+        f1_ax.set_title(f'Detection Quality for {self.label}')
+
+        width = 0.35
+        latency_ax.bar(x - width / 2, [comparison[name]["metrics"]["p50"] * 1000 for name in names], width,
+                       color='#4CAF50', label='p50')
+        latency_ax.bar(x + width / 2, [comparison[name]["metrics"]["p99"] * 1000 for name in names], width,
+                       color='#F44336', label='p99')
+        latency_ax.set_xticks(x, names)
+        latency_ax.set_ylabel('Milliseconds')
+        latency_ax.set_title(f'Scan Latency for {self.label}')
+        latency_ax.legend()
+
+        plt.tight_layout()
+        return fig
+
+    def display_results(self, save_path=None):
+        """
+        Display the comparison table and plot.
+
+        :param save_path: Optional path to save the plot
+        """
+        import matplotlib.pyplot as plt
+
+        print(f"Comparison for {self.label}")
+        print("=" * 40)
+        for line in self._format_comparison():
+            print(line)
+
+        fig = self.plot_comparison()
+        plt.show()
+        if save_path:
+            fig.savefig(save_path, dpi=300, bbox_inches='tight')
+            print(f"\nComparison plot saved to {save_path}")
+
+    def save_to_file(self, output_dir: str):
+        """
+        Save the comparison, and the metrics of every variant, to files.
+
+        :param output_dir: Path to the output directory
+        """
+        import matplotlib.pyplot as plt
+
+        os.makedirs(output_dir, exist_ok=True)
+        for metrics in self.variants.values():
+            metrics.save_to_file(output_dir)
+
+        base_filename = os.path.join(output_dir, f"{self.label.replace(' ', '_')}")
+        with open(f"{base_filename}_comparison.json", 'w') as f:
+            json.dump({
+                "label": self.label,
+                "baseline": self.baseline,
+                "variants": {name: metrics.label for name, metrics in self.variants.items()},
+                "comparison": self.calculate_comparison(),
+                "agreement": self.calculate_agreement()
+                if any(len(metrics.predictions) > 0 for metrics in self.variants.values()) else None
+            }, f, indent=2)
+
+        with open(f"{base_filename}_comparison.txt", 'w') as f:
+            f.write(f"Comparison for {self.label}\n")
+            f.write("=" * 40 + "\n")
+            for line in self._format_comparison():
+                f.write(f"{line}\n")
+
+        # Rows predicted differently than by the baseline, for review
+        if any(len(metrics.predictions) > 0 for metrics in self.variants.values()):
+            with open(f"{base_filename}_flips.jsonl", 'w') as f:
+                for flip in self.find_flipped_predictions():
+                    f.write(json.dumps(flip) + "\n")
+
+        fig = self.plot_comparison()
+        fig.savefig(f"{base_filename}_comparison.png", dpi=300, bbox_inches='tight')
+        plt.close(fig)
+
+        print(f"Comparison saved to {output_dir}")
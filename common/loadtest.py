@@ -0,0 +1,190 @@
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
+
+import numpy as np
+
+
+class LoadTestResult:
+    def __init__(self, label: str, concurrency: int, target_qps: float = None):
+        """
+        Initialize the LoadTestResult class.
+
+        :param label: Label of the load tested scanner
+        :param concurrency: Number of requests served concurrently
+        :param target_qps: Target request rate, None when requests are sent back to back
+        """
+        self.label = label
+        self.concurrency = concurrency
+        self.target_qps = target_qps
+        self.duration = 0.0
+        self.errors = 0
+
+        # Per-request service latency and time spent waiting for a free worker, in seconds
+        self.latencies = array("d")
+        self.queue_delays = array("d")
+
+    def calculate_metrics(self):
+        """
+        Calculate the throughput and latency metrics of the load test.
+
+        :return: Dictionary of metrics (latencies and delays in seconds)
+        """
+        requests = len(self.latencies)
+        if requests == 0:
+            return {}
+
+        latencies = np.array(self.latencies, dtype=np.float64)
+        queue_delays = np.array(self.queue_delays, dtype=np.float64)
+        # End-to-end latency as seen by the caller: queueing + service
+        response_times = latencies + queue_delays
+
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "achieved_qps": requests / self.duration if self.duration > 0 else 0,
+            "latency_p50": float(np.percentile(latencies, 50)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+            "latency_p99": float(np.percentile(latencies, 99)),
+            "queue_delay_p50": float(np.percentile(queue_delays, 50)),
+            "queue_delay_p99": float(np.percentile(queue_delays, 99)),
+            "queue_delay_max": float(queue_delays.max()),
+            "response_time_p99": float(np.percentile(response_times, 99))
+        }
+
+
+def run_load_test(label: str, scan: Callable[[str], Any], prompts: List[str], concurrency: int,
+                  target_qps: float = None, num_requests: int = None) -> LoadTestResult:
+    """
+    Replay prompts against a scanner from a pool of concurrent callers.
+
+    With a target QPS, requests arrive on a fixed schedule whether or not a worker is free
+    (open loop), so overload shows up as queueing delay. Without it, a new request is sent
+    as soon as one of the `concurrency` callers is free (closed loop).
+
+    Args:
+        label: Label of the load tested scanner
+        scan: Function scanning one prompt, it must be safe to call from several threads
+        prompts: Prompts to replay, cycled if more requests than prompts are sent
+        concurrency: Number of concurrent callers
+        target_qps: Optional request arrival rate
+        num_requests: Number of requests to send (defaults to one per prompt)
+
+    Returns:
+        A LoadTestResult with the per-request latencies and queueing delays
+    """
+    result = LoadTestResult(label, concurrency, target_qps)
+    num_requests = num_requests or len(prompts)
+    lock = threading.Lock()
+    free_callers = threading.Semaphore(concurrency)
+
+    def serve(prompt: str, scheduled_at: float):
+        start = time.perf_counter()
+        try:
+            scan(prompt)
+            failed = False
+        except Exception:
+            failed = True
+        end = time.perf_counter()
+
+        with lock:
+            result.latencies.append(end - start)
+            result.queue_delays.append(start - scheduled_at)
+            result.errors += failed
+        if target_qps is None:
+            free_callers.release()
+
+    test_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(num_requests):
+            if target_qps is not None:
+                # Open loop: the request is due at its scheduled time
+                scheduled_at = test_start + i / target_qps
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                # Closed loop: wait for a caller to be free
+                free_callers.acquire()
+                scheduled_at = time.perf_counter()
+            executor.submit(serve, prompts[i % len(prompts)], scheduled_at)
+    result.duration = time.perf_counter() - test_start
+
+    return result
+
+
+def run_load_tests(label: str, scan: Callable[[str], Any], prompts: List[str], concurrency_levels: List[int],
+                   target_qps: float = None, num_requests: int = None) -> List[LoadTestResult]:
+    """
+    Run a load test for each concurrency level.
+
+    Args:
+        label: Label of the load tested scanner
+        scan: Function scanning one prompt, it must be safe to call from several threads
+        prompts: Prompts to replay
+        concurrency_levels: Numbers of concurrent callers to test
+        target_qps: Optional request arrival rate, used for every level
+        num_requests: Number of requests per level (defaults to one per prompt)
+
+    Returns:
+        One LoadTestResult per concurrency level
+    """
+    results = []
+    for concurrency in concurrency_levels:
+        print(f"Load testing {label} with {concurrency} concurrent callers"
+              + (f" at {target_qps} QPS..." if target_qps else "..."))
+        results.append(run_load_test(label, scan, prompts, concurrency, target_qps, num_requests))
+    return results
+
+
+def display_load_tests(results: List[LoadTestResult], save_path: str = None):
+    """
+    Display the load test results as a table and plot latency and throughput against concurrency.
+
+    :param results: Load test results, one per concurrency level
+    :param save_path: Optional path to save the plot
+    """
+    import matplotlib.pyplot as plt
+
+    label = results[0].label if results else ""
+    print(f"Load Test Results for {label}")
+    print("=" * 40)
+    print("Concurrency  QPS       p50 (ms)  p95 (ms)  p99 (ms)  Queue p50 (ms)  Queue p99 (ms)  Errors")
+
+    rows = []
+    for result in results:
+        metrics = result.calculate_metrics()
+        if not metrics:
+            continue
+        rows.append((result.concurrency, metrics))
+        print(f"{result.concurrency:<11d}  {metrics['achieved_qps']:<8.2f}  "
+              f"{metrics['latency_p50'] * 1000:<8.2f}  {metrics['latency_p95'] * 1000:<8.2f}  "
+              f"{metrics['latency_p99'] * 1000:<8.2f}  {metrics['queue_delay_p50'] * 1000:<14.2f}  "
+              f"{metrics['queue_delay_p99'] * 1000:<14.2f}  {metrics['errors']}")
+
+    if not rows:
+        return
+
+    concurrency = [c for c, _ in rows]
+    fig, (latency_ax, qps_ax) = plt.subplots(1, 2, figsize=(14, 6))
+
+    for key, color in [('latency_p50', '#4CAF50'), ('latency_p99', '#F44336'), ('response_time_p99', '#FF9800')]:
+        latency_ax.plot(concurrency, [m[key] * 1000 for _, m in rows], marker='o', color=color, label=key)
+    latency_ax.set_xlabel('Concurrency')
+    latency_ax.set_ylabel('Milliseconds')
+    latency_ax.set_title(f'Latency under Load for {label}')
+    latency_ax.legend()
+
+    qps_ax.plot(concurrency, [m['achieved_qps'] for _, m in rows], marker='o', color='#2196F3')
+    qps_ax.set_xlabel('Concurrency')
+    qps_ax.set_ylabel('Requests/s')
+    qps_ax.set_title(f'Achieved Throughput for {label}')
+
+    plt.tight_layout()
+    plt.show()
+
+    if save_path:
+        fig.savefig(save_path, dpi=300, bbox_inches='tight')
+        print(f"\nLoad test plot saved to {save_path}")
@@ -1,18 +1,27 @@
+from array import array
 from datetime import datetime
-from typing import Any, Dict, List
-import matplotlib.pyplot as plt
+from typing import Any, Dict, List, Optional
 import numpy as np
 import json
 import os
+import random
+
+# matplotlib is imported by the plotting methods only, it is slow to import and
+# headless runs that just compute and save metrics should not pay for it
 
 class EvaluationMetrics:
-    def __init__(self, label: str, start_date: datetime = None, end_date: datetime = None):
+    def __init__(self, label: str, start_date: datetime = None, end_date: datetime = None,
+                 max_details: int = None, spill_dir: str = None, seed: int = 0):
         """
         Initialize the EvaluationMetrics class.
         
         :param label: Label for the classification model
         :param start_date: Optional start date of evaluation
         :param end_date: Optional end date of evaluation
+        :param max_details: Optional maximum number of details kept in memory per category,
+            the kept details are a uniform reservoir sample of all the details
+        :param spill_dir: Optional directory where the details beyond max_details are streamed as JSONL
+        :param seed: Seed of the reservoir sampling
         """
         self.label = label
         self.start_date = start_date or datetime.now()
@@ -34,6 +43,53 @@ class EvaluationMetrics:
             "tn": [],
             "fn": []
         }
+        
+        # Scans that failed (model or runtime errors), kept out of the confusion matrix
+        self.scan_error_count = 0
+        self.scan_errors: List[Any] = []
+        
+        # Optional per entity type statistics (e.g. span-level PII scoring)
+        self.entity_statistics: Dict[str, Dict[str, int]] = {}
+        # Detected spans whose source offsets are ambiguous, counted as false positives by the span matching
+        self.unaligned_span_count = 0
+        
+        # Bounded details storage: reservoir of max_details per category, the rest is spilled to disk
+        self.max_details = max_details
+        self.spill_dir = spill_dir
+        self.spill_files: List[str] = []
+        self.details_seen: Dict[str, int] = {stat_type: 0 for stat_type in self.errors}
+        self._rng = random.Random(seed)
+        self._spill_file = None
+        
+        # Per-sample scan latencies in seconds, stored as a compact array of doubles
+        self.latencies = array("d")
+        
+        # Cold-start costs, kept apart from the steady-state latencies
+        self.model_load_time: float = None
+        self.warmup_latency: float = None
+        
+        # Resident memory in bytes: taken by loading the model, and of the process at the end of the evaluation
+        self.model_memory: int = None
+        self.resident_memory: int = None
+        # Size in bytes of the PyTorch model weights (parameters and buffers), which doesn't depend on the allocator
+        self.model_weights: int = None
+        
+        # Per-row predictions and ground truth labels, in dataset order (to compare runs row by row)
+        self.predictions = array("b")
+        self.prediction_labels = array("b")
+        
+        # Total time spent scoring the scanner outputs, kept apart from the scan latencies
+        self.scoring_time = 0.0
+        
+        # Scanned tokens, and the tokens of the batched scans without and with their padding
+        self.token_count = 0
+        self.batched_token_count = 0
+        self.padded_token_count = 0
+        
+        # Raw detection scores and ground truth labels, used for threshold sweeps
+        self.scores = array("d")
+        self.score_labels = array("b")
+        self.sweep_thresholds: List[float] = []
     
     def increment_statistic(self, stat_type: str, value: int = 1, details: Any = None):
         """
@@ -50,10 +106,388 @@ class EvaluationMetrics:
         
         # Add error details if provided
         if details is not None:
-            self.errors[stat_type].append(details)
+            self._add_details(stat_type, details)
+
+    def record_scan_error(self, details: Any = None):
+        """
+        Count a scan that failed instead of returning a prediction.
+        
+        :param details: Optional details (e.g. text and error message), at most max_details are kept
+        """
+        self.scan_error_count += 1
+        if details is not None and (self.max_details is None or len(self.scan_errors) < self.max_details):
+            self.scan_errors.append(details)
+
+    def increment_entity_statistic(self, entity_type: str, stat_type: str, value: int = 1):
+        """
+        Increment a statistic of one entity type, on top of the global statistics.
+        
+        :param entity_type: The entity type (e.g. EMAIL_ADDRESS)
+        :param stat_type: Type of statistic to increment (tp, fp, tn, fn)
+        :param value: Amount to increment (default 1)
+        """
+        if stat_type not in self.statistics:
+            raise ValueError(f"Invalid statistic type: {stat_type}")
+        
+        entity_statistics = self.entity_statistics.setdefault(entity_type, {"tp": 0, "fp": 0, "tn": 0, "fn": 0})
+        entity_statistics[stat_type] += value
+
+    def calculate_entity_metrics(self):
+        """
+        Calculate precision, recall and F1 score of each entity type.
+        
+        :return: Dictionary of metrics per entity type
+        """
+        entity_metrics = {}
+        for entity_type, stats in sorted(self.entity_statistics.items()):
+            precision = stats["tp"] / (stats["tp"] + stats["fp"]) if (stats["tp"] + stats["fp"]) > 0 else 0
+            recall = stats["tp"] / (stats["tp"] + stats["fn"]) if (stats["tp"] + stats["fn"]) > 0 else 0
+            entity_metrics[entity_type] = {
+                **stats,
+                "precision": precision,
+                "recall": recall,
+                "f1_score": 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0
+            }
+        return entity_metrics
+
+    def _add_details(self, stat_type: str, details: Any):
+        """Keep the details in the category reservoir, spilling the ones not kept"""
+        self.details_seen[stat_type] += 1
+        kept = self.errors[stat_type]
+        
+        if self.max_details is None or len(kept) < self.max_details:
+            kept.append(details)
+            return
+        
+        # Reservoir sampling: each of the n details seen so far is kept with probability max_details/n
+        slot = self._rng.randrange(self.details_seen[stat_type])
+        if slot < self.max_details:
+            kept[slot], details = details, kept[slot]
+        self._spill(stat_type, details)
+
+    def spill_path(self) -> Optional[str]:
+        """Path of this process' JSONL spill file (None without spill directory)"""
+        if self.spill_dir is None:
+            return None
+        return os.path.join(self.spill_dir, f"{self.label.replace(' ', '_')}_{os.getpid()}_details.jsonl")
+
+    def _spill(self, stat_type: str, details: Any):
+        """Stream details that are not kept in memory to this process' JSONL spill file"""
+        if self.spill_dir is None:
+            return
+        
+        if self._spill_file is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = self.spill_path()
+            self._spill_file = open(path, "a", encoding="utf-8")
+            if path not in self.spill_files:
+                self.spill_files.append(path)
+        
+        self._spill_file.write(json.dumps({"category": stat_type, "details": details}, default=str) + "\n")
+
+    def flush_details(self):
+        """Flush and close the spill file, it is reopened on the next spilled details"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def __getstate__(self):
+        # Open files can't be pickled (shards, checkpoints), flush them first
+        self.flush_details()
+        return self.__dict__.copy()
 
     def increment_evaluated_prompts(self):
         self.evaluated_prompts += 1
+
+    def record_latency(self, seconds: float):
+        """
+        Record the duration of one scan call.
+        
+        :param seconds: Scan duration measured with a monotonic clock (time.perf_counter)
+        """
+        self.latencies.append(seconds)
+
+    def record_scoring_time(self, seconds: float):
+        """
+        Record the time spent scoring one scanner output against the ground truth.
+        
+        :param seconds: Scoring duration measured with a monotonic clock (time.perf_counter)
+        """
+        self.scoring_time += seconds
+
+    def record_tokens(self, tokens: int, padded_tokens: int = None):
+        """
+        Record the number of tokens of scanned texts.
+        
+        :param tokens: Number of tokens of the texts
+        :param padded_tokens: Number of tokens once padded in batches, None when the texts weren't batched
+        """
+        self.token_count += tokens
+        if padded_tokens is not None:
+            self.batched_token_count += tokens
+            self.padded_token_count += padded_tokens
+
+    def record_prediction(self, predicted: bool, ground_truth: bool):
+        """
+        Record the binary prediction of one row, in dataset order.
+        
+        :param predicted: Whether the scanner flagged the row
+        :param ground_truth: Whether the row is a positive in the ground truth
+        """
+        self.predictions.append(predicted)
+        self.prediction_labels.append(ground_truth)
+
+    def record_score(self, score: float, ground_truth: bool):
+        """
+        Record the raw detection score of one sample, before any threshold is applied.
+        
+        :param score: Raw score of the detector (higher means more likely positive)
+        :param ground_truth: Whether the sample is actually positive
+        """
+        self.scores.append(score)
+        self.score_labels.append(1 if ground_truth else 0)
+
+    def calculate_threshold_sweep(self, thresholds: List[float] = None):
+        """
+        Calculate the confusion counts and metrics for many thresholds in one vectorized pass.
+        
+        A sample is predicted positive when its score is strictly above the threshold.
+        
+        :param thresholds: Thresholds to evaluate (defaults to the sweep thresholds, or 0 to 1 by 0.01)
+        :return: Dictionary of arrays (thresholds, tp, fp, tn, fn, precision, recall, f1_score, specificity)
+        """
+        if thresholds is None:
+            thresholds = self.sweep_thresholds or np.linspace(0, 1, 101)
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        
+        scores = np.array(self.scores, dtype=np.float64)
+        labels = np.array(self.score_labels, dtype=bool)
+        positive_scores = np.sort(scores[labels])
+        negative_scores = np.sort(scores[~labels])
+        
+        # Number of scores strictly above each threshold, for positives and negatives
+        tp = len(positive_scores) - np.searchsorted(positive_scores, thresholds, side="right")
+        fp = len(negative_scores) - np.searchsorted(negative_scores, thresholds, side="right")
+        fn = len(positive_scores) - tp
+        tn = len(negative_scores) - fp
+        
+        def safe_divide(numerator, denominator):
+            return np.divide(numerator, denominator, out=np.zeros(len(thresholds)), where=denominator > 0)
+        
+        precision = safe_divide(tp, tp + fp)
+        recall = safe_divide(tp, tp + fn)
+        
+        return {
+            "thresholds": thresholds,
+            "tp": tp,
+            "fp": fp,
+            "tn": tn,
+            "fn": fn,
+            "precision": precision,
+            "recall": recall,
+            "f1_score": safe_divide(2 * precision * recall, precision + recall),
+            "specificity": safe_divide(tn, tn + fp)
+        }
+
+    def _calculate_score_curves(self):
+        """
+        Calculate the ROC and precision/recall curves over every distinct recorded score.
+        
+        :return: (fpr, tpr, precision, recall) arrays, ordered by decreasing threshold
+        """
+        scores = np.array(self.scores, dtype=np.float64)
+        labels = np.array(self.score_labels, dtype=bool)
+        
+        order = np.argsort(-scores, kind="mergesort")
+        scores, labels = scores[order], labels[order]
+        
+        # Keep the last index of each distinct score so tied samples switch together
+        distinct = np.r_[np.nonzero(np.diff(scores))[0], len(scores) - 1]
+        tp = np.cumsum(labels)[distinct]
+        fp = (distinct + 1) - tp
+        
+        total_positives = max(int(labels.sum()), 1)
+        total_negatives = max(int((~labels).sum()), 1)
+        
+        fpr = np.r_[0, fp / total_negatives]
+        tpr = np.r_[0, tp / total_positives]
+        precision = np.r_[1, tp / (tp + fp)]
+        recall = np.r_[0, tp / total_positives]
+        return fpr, tpr, precision, recall
+
+    def calculate_curve_metrics(self):
+        """
+        Calculate the threshold independent metrics of the recorded scores.
+        
+        :return: Dictionary with the ROC-AUC and PR-AUC (average precision)
+        """
+        if len(self.scores) == 0:
+            return {}
+        
+        fpr, tpr, precision, recall = self._calculate_score_curves()
+        return {
+            "roc_auc": float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)),
+            "pr_auc": float(np.sum(np.diff(recall) * precision[1:]))
+        }
+
+    def calculate_latency_metrics(self):
+        """
+        Calculate the latency distribution of the recorded scan calls.
+        
+        :return: Dictionary of latency percentiles (in seconds) and throughput
+        """
+        if len(self.latencies) == 0:
+            return {}
+        
+        latencies = np.array(self.latencies, dtype=np.float64)
+        p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99])
+        total_scan_time = float(latencies.sum())
+        
+        latency_metrics = {
+            "samples": len(latencies),
+            "mean": float(latencies.mean()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(latencies.max()),
+            # Samples per second of pure scan time
+            "scan_throughput": len(latencies) / total_scan_time if total_scan_time > 0 else 0
+        }
+        
+        # Samples per second of wall time, including dataset iteration and scoring
+        if self.end_date:
+            wall_time = (self.end_date - self.start_date).total_seconds()
+            latency_metrics["wall_throughput"] = self.evaluated_prompts / wall_time if wall_time > 0 else 0
+        
+        # Cold-start costs
+        if self.model_load_time is not None:
+            latency_metrics["model_load_time"] = self.model_load_time
+        if self.warmup_latency is not None:
+            latency_metrics["warmup_latency"] = self.warmup_latency
+        
+        # Memory footprint
+        if self.model_memory is not None:
+            latency_metrics["model_memory_mb"] = self.model_memory / 1024 ** 2
+        if self.resident_memory is not None:
+            latency_metrics["resident_memory_mb"] = self.resident_memory / 1024 ** 2
+        if self.model_weights is not None:
+            latency_metrics["model_weights_mb"] = self.model_weights / 1024 ** 2
+        
+        # Token throughput, and share of padding tokens in the batches (only when texts were really batched)
+        if self.token_count > 0:
+            latency_metrics["tokens_per_second"] = self.token_count / total_scan_time if total_scan_time > 0 else 0
+        if self.padded_token_count > 0:
+            latency_metrics["padding_waste"] = 1 - self.batched_token_count / self.padded_token_count
+        
+        # Scoring overhead, per evaluated prompt and relative to the scan time
+        if self.scoring_time > 0:
+            latency_metrics["scoring_mean"] = self.scoring_time / max(self.evaluated_prompts, 1)
+            latency_metrics["scoring_overhead"] = self.scoring_time / total_scan_time if total_scan_time > 0 else 0
+        
+        return latency_metrics
+
+    @classmethod
+    def merge(cls, metrics_list: List["EvaluationMetrics"], label: str = None) -> "EvaluationMetrics":
+        """
+        Merge the metrics of several evaluations (e.g. dataset shards) into one.
+        
+        Statistics and evaluated prompts are summed, error details are concatenated
+        in the order of the given list, and the evaluation window spans from the
+        earliest start date to the latest end date.
+        
+        :param metrics_list: Metrics to merge, in shard order
+        :param label: Optional label of the merged metrics (defaults to the first label)
+        :return: The merged EvaluationMetrics
+        """
+        if not metrics_list:
+            raise ValueError("Cannot merge an empty list of metrics")
+        
+        merged = cls(
+            label or metrics_list[0].label,
+            start_date=min(m.start_date for m in metrics_list),
+            max_details=metrics_list[0].max_details,
+            spill_dir=metrics_list[0].spill_dir
+        )
+        end_dates = [m.end_date for m in metrics_list]
+        merged.end_date = max(end_dates) if None not in end_dates else None
+        
+        for m in metrics_list:
+            merged.evaluated_prompts += m.evaluated_prompts
+            merged.scan_error_count += m.scan_error_count
+            for details in m.scan_errors:
+                if merged.max_details is None or len(merged.scan_errors) < merged.max_details:
+                    merged.scan_errors.append(details)
+            for stat_type, value in m.statistics.items():
+                merged.statistics[stat_type] += value
+            for entity_type, stats in m.entity_statistics.items():
+                for stat_type, value in stats.items():
+                    merged.increment_entity_statistic(entity_type, stat_type, value)
+            merged.unaligned_span_count += m.unaligned_span_count
+            for stat_type in m.errors:
+                merged.details_seen[stat_type] += m.details_seen[stat_type]
+            merged.spill_files.extend(path for path in m.spill_files if path not in merged.spill_files)
+            merged.latencies.extend(m.latencies)
+            merged.scoring_time += m.scoring_time
+            # Every shard process holds its own model, their memory adds up
+            if m.model_memory is not None:
+                merged.model_memory = (merged.model_memory or 0) + m.model_memory
+            if m.model_weights is not None:
+                merged.model_weights = (merged.model_weights or 0) + m.model_weights
+            if m.resident_memory is not None:
+                merged.resident_memory = (merged.resident_memory or 0) + m.resident_memory
+            merged.predictions.extend(m.predictions)
+            merged.prediction_labels.extend(m.prediction_labels)
+            merged.token_count += m.token_count
+            merged.batched_token_count += m.batched_token_count
+            merged.padded_token_count += m.padded_token_count
+            # Shards load their scanners in parallel, the slowest one is the cold-start cost
+            if m.model_load_time is not None:
+                merged.model_load_time = max(merged.model_load_time or 0, m.model_load_time)
+            if m.warmup_latency is not None:
+                merged.warmup_latency = max(merged.warmup_latency or 0, m.warmup_latency)
+            merged.scores.extend(m.scores)
+            merged.score_labels.extend(m.score_labels)
+            merged.sweep_thresholds = merged.sweep_thresholds or m.sweep_thresholds
+        
+        for stat_type in merged.errors:
+            merged._merge_reservoirs(stat_type, metrics_list)
+        
+        return merged
+
+    def _merge_reservoirs(self, stat_type: str, metrics_list: List["EvaluationMetrics"]):
+        """
+        Merge the details of several metrics so the result stays a uniform sample of all details.
+        
+        Without a cap the details are simply concatenated. With a cap, the number of details
+        taken from each reservoir follows the share of details it has seen, and the details
+        that are not taken are spilled.
+        """
+        reservoirs = [m.errors[stat_type] for m in metrics_list]
+        if self.max_details is None or sum(len(r) for r in reservoirs) <= self.max_details:
+            for reservoir in reservoirs:
+                self.errors[stat_type].extend(reservoir)
+            return
+        
+        # Draw max_details details without replacement from the seen details of all reservoirs
+        remaining = [m.details_seen[stat_type] for m in metrics_list]
+        taken = [0] * len(reservoirs)
+        for _ in range(self.max_details):
+            draw = self._rng.randrange(sum(remaining))
+            for i, count in enumerate(remaining):
+                if draw < count:
+                    taken[i] += 1
+                    remaining[i] -= 1
+                    break
+                draw -= count
+        
+        for reservoir, count in zip(reservoirs, taken):
+            kept_indices = set(self._rng.sample(range(len(reservoir)), count))
+            for i, details in enumerate(reservoir):
+                if i in kept_indices:
+                    self.errors[stat_type].append(details)
+                else:
+                    self._spill(stat_type, details)
     
     def calculate_metrics(self):
         """
@@ -94,6 +528,8 @@ class EvaluationMetrics:
         """
         Plot the confusion matrix as a heatmap.
         """
+        import matplotlib.pyplot as plt
+        
         # Create a figure and axis
         fig, ax = plt.subplots(figsize=(8, 6))
         
@@ -137,6 +573,8 @@ class EvaluationMetrics:
         """
         Plot the performance metrics as a bar chart.
         """
+        import matplotlib.pyplot as plt
+        
         # Create a figure and axis
         fig, ax = plt.subplots(figsize=(10, 6))
         
@@ -173,6 +611,8 @@ class EvaluationMetrics:
         """
         Plot the distribution of TP, FP, TN, FN as a pie chart.
         """
+        import matplotlib.pyplot as plt
+        
         # Create a figure and axis
         fig, ax = plt.subplots(figsize=(8, 8))
         
@@ -195,12 +635,164 @@ class EvaluationMetrics:
         
         return fig
     
+    def plot_latency_histogram(self):
+        """
+        Plot the distribution of per-sample scan latencies as a histogram.
+        """
+        import matplotlib.pyplot as plt
+        
+        # Create a figure and axis
+        fig, ax = plt.subplots(figsize=(10, 6))
+        
+        latencies_ms = np.array(self.latencies, dtype=np.float64) * 1000
+        ax.hist(latencies_ms, bins=50, color='skyblue', edgecolor='black')
+        
+        # Mark the main percentiles
+        latency_metrics = self.calculate_latency_metrics()
+        for percentile, color in [('p50', '#4CAF50'), ('p95', '#FF9800'), ('p99', '#F44336')]:
+            if percentile in latency_metrics:
+                ax.axvline(latency_metrics[percentile] * 1000, color=color, linestyle='--',
+                           label=f"{percentile}: {latency_metrics[percentile] * 1000:.1f} ms")
+        ax.legend()
+        
+        # Add labels and title
+        plt.xlabel('Latency (ms)')
+        plt.ylabel('Samples')
+        plt.title(f'Scan Latency Distribution for {self.label}')
+        
+        # Ensure layout is tight
+        plt.tight_layout()
+        
+        return fig
+    
+    def plot_score_curves(self):
+        """
+        Plot the ROC and precision/recall curves of the recorded scores.
+        """
+        import matplotlib.pyplot as plt
+        
+        # Create a figure with one axis per curve
+        fig, (roc_ax, pr_ax) = plt.subplots(1, 2, figsize=(14, 6))
+        
+        fpr, tpr, precision, recall = self._calculate_score_curves()
+        curve_metrics = self.calculate_curve_metrics()
+        
+        roc_ax.plot(fpr, tpr, color='#2196F3', label=f"ROC-AUC: {curve_metrics['roc_auc']:.4f}")
+        roc_ax.plot([0, 1], [0, 1], color='grey', linestyle='--')
+        roc_ax.set_xlabel('False Positive Rate')
+        roc_ax.set_ylabel('True Positive Rate')
+        roc_ax.set_title(f'ROC Curve for {self.label}')
+        roc_ax.legend()
+        
+        pr_ax.step(recall, precision, where='post', color='#4CAF50', label=f"PR-AUC: {curve_metrics['pr_auc']:.4f}")
+        pr_ax.set_xlabel('Recall')
+        pr_ax.set_ylabel('Precision')
+        pr_ax.set_ylim(0, 1.05)
+        pr_ax.set_title(f'Precision/Recall Curve for {self.label}')
+        pr_ax.legend()
+        
+        # Ensure layout is tight
+        plt.tight_layout()
+        
+        return fig
+    
+    def plot_threshold_sweep(self):
+        """
+        Plot precision, recall and F1 score against the detection threshold.
+        """
+        import matplotlib.pyplot as plt
+        
+        # Create a figure and axis
+        fig, ax = plt.subplots(figsize=(10, 6))
+        
+        sweep = self.calculate_threshold_sweep()
+        for metric, color in [('precision', '#2196F3'), ('recall', '#4CAF50'), ('f1_score', '#F44336')]:
+            ax.plot(sweep['thresholds'], sweep[metric], color=color, label=metric)
+        ax.set_ylim(0, 1.05)
+        ax.legend()
+        
+        # Add labels and title
+        plt.xlabel('Threshold')
+        plt.ylabel('Value')
+        plt.title(f'Threshold Sweep for {self.label}')
+        
+        # Ensure layout is tight
+        plt.tight_layout()
+        
+        return fig
+    
+    def _format_threshold_sweep(self):
+        """Format the threshold sweep and curve metrics as report lines"""
+        curve_metrics = self.calculate_curve_metrics()
+        lines = [
+            f"ROC-AUC:     {curve_metrics['roc_auc']:.4f}",
+            f"PR-AUC:      {curve_metrics['pr_auc']:.4f}",
+            "Threshold  Precision  Recall  F1 Score  FP      FN"
+        ]
+        if self.sweep_thresholds:
+            sweep = self.calculate_threshold_sweep()
+            for i, threshold in enumerate(sweep['thresholds']):
+                lines.append(f"{threshold:<9.3f}  {sweep['precision'][i]:<9.4f}  {sweep['recall'][i]:<6.4f}  "
+                             f"{sweep['f1_score'][i]:<8.4f}  {sweep['fp'][i]:<6d}  {sweep['fn'][i]}")
+        else:
+            lines.pop()
+        return lines
+    
+    def _format_entity_metrics(self):
+        """Format the per entity type statistics as report lines"""
+        lines = ["Entity type       TP      FP      FN      Precision  Recall  F1 Score"]
+        for entity_type, m in self.calculate_entity_metrics().items():
+            lines.append(f"{entity_type:<16}  {m['tp']:<6d}  {m['fp']:<6d}  {m['fn']:<6d}  "
+                         f"{m['precision']:<9.4f}  {m['recall']:<6.4f}  {m['f1_score']:.4f}")
+        return lines
+    
+    def _format_details_count(self, stat_type: str):
+        """Describe how many details of a category are kept in memory"""
+        kept = len(self.errors[stat_type])
+        if kept < self.details_seen[stat_type]:
+            return f"{kept} sampled entries out of {self.details_seen[stat_type]}"
+        return f"{kept} entries"
+    
+    def _format_latency_metrics(self, latency_metrics):
+        """Format the latency metrics as report lines"""
+        lines = [
+            f"p50:         {latency_metrics['p50'] * 1000:.2f} ms",
+            f"p90:         {latency_metrics['p90'] * 1000:.2f} ms",
+            f"p95:         {latency_metrics['p95'] * 1000:.2f} ms",
+            f"p99:         {latency_metrics['p99'] * 1000:.2f} ms",
+            f"Max:         {latency_metrics['max'] * 1000:.2f} ms",
+            f"Mean:        {latency_metrics['mean'] * 1000:.2f} ms",
+            f"Scan throughput: {latency_metrics['scan_throughput']:.2f} samples/s",
+        ]
+        if "wall_throughput" in latency_metrics:
+            lines.append(f"Wall throughput: {latency_metrics['wall_throughput']:.2f} samples/s")
+        if "model_load_time" in latency_metrics:
+            lines.append(f"Model load:  {latency_metrics['model_load_time']:.2f} s")
+        if "warmup_latency" in latency_metrics:
+            lines.append(f"Warmup:      {latency_metrics['warmup_latency'] * 1000:.2f} ms (first call)")
+        if "model_memory_mb" in latency_metrics:
+            lines.append(f"Model memory: {latency_metrics['model_memory_mb']:.1f} MB")
+        if "model_weights_mb" in latency_metrics:
+            lines.append(f"Model weights: {latency_metrics['model_weights_mb']:.1f} MB")
+        if "resident_memory_mb" in latency_metrics:
+            lines.append(f"Resident memory: {latency_metrics['resident_memory_mb']:.1f} MB (end of evaluation)")
+        if "tokens_per_second" in latency_metrics:
+            padding = (f"{latency_metrics['padding_waste']:.2%} padding" if "padding_waste" in latency_metrics
+                       else "unbatched")
+            lines.append(f"Token throughput: {latency_metrics['tokens_per_second']:.2f} tokens/s ({padding})")
+        if "scoring_mean" in latency_metrics:
+            lines.append(f"Scoring:     {latency_metrics['scoring_mean'] * 1000:.3f} ms "
+                         f"({latency_metrics['scoring_overhead']:.2%} of scan time)")
+        return lines
+    
     def display_results(self, save_path=None):
         """
         Display a formatted summary of evaluation metrics with visualizations.
         
         :param save_path: Optional path to save the visualizations
         """
+        import matplotlib.pyplot as plt
+        
         print(f"Evaluation Metrics for {self.label}")
         print("=" * 40)
         
@@ -208,6 +800,8 @@ class EvaluationMetrics:
         print("\nConfusion Matrix Statistics:")
         for stat, value in self.statistics.items():
             print(f"{stat.upper()}: {value}")
+        if self.scan_error_count:
+            print(f"Scan errors: {self.scan_error_count} (not counted above)")
         
         # Calculate and print performance metrics
         metrics = self.calculate_metrics()
@@ -220,10 +814,18 @@ class EvaluationMetrics:
             print(f"F1 Score:    {metrics['f1_score']:.4f}")
             print(f"Specificity: {metrics.get('specificity', 0):.4f}")
         
+        # Print per entity type statistics
+        if self.entity_statistics:
+            print("\nPer Entity Metrics:")
+            for line in self._format_entity_metrics():
+                print(line)
+        if self.unaligned_span_count:
+            print(f"Unaligned spans: {self.unaligned_span_count} (ambiguous offsets, counted as FP)")
+        
         # Print error details if available
         print("\nError Details:")
         for error_type, error_list in self.errors.items():
-            print(f"{error_type.upper()} Details ({len(error_list)} entries):")
+            print(f"{error_type.upper()} Details ({self._format_details_count(error_type)}):")
             for idx, error in enumerate(error_list[:5]):  # Display up to 5 error details
                 print(f"\n[====<{idx}>====] ")
                 for key, value in error.items():
@@ -238,12 +840,28 @@ class EvaluationMetrics:
             print(f"\nEvaluation Duration: {eval_duration}")
             print(f"\nMean processing time: {eval_duration/self.evaluated_prompts}")
         
+        # Print scan latency distribution
+        latency_metrics = self.calculate_latency_metrics()
+        if latency_metrics:
+            print(f"\nScan Latency ({latency_metrics['samples']} samples):")
+            for line in self._format_latency_metrics(latency_metrics):
+                print(line)
+        
+        # Print threshold sweep
+        if len(self.scores) > 0:
+            print(f"\nThreshold Sweep ({len(self.scores)} scored samples):")
+            for line in self._format_threshold_sweep():
+                print(line)
+        
         # Create and display visualizations
         try:
             # Generate plots
             confusion_matrix_fig = self.plot_confusion_matrix()
             metrics_bar_fig = self.plot_metrics_bar(metrics)
             distribution_pie_fig = self.plot_distribution_pie()
+            latency_histogram_fig = self.plot_latency_histogram() if latency_metrics else None
+            score_curves_fig = self.plot_score_curves() if len(self.scores) > 0 else None
+            threshold_sweep_fig = self.plot_threshold_sweep() if len(self.scores) > 0 else None
             
             # Show plots
             plt.show()
@@ -257,6 +875,11 @@ class EvaluationMetrics:
                 confusion_matrix_fig.savefig(os.path.join(save_path, f"{self.label}_confusion_matrix.png"))
                 metrics_bar_fig.savefig(os.path.join(save_path, f"{self.label}_metrics.png"))
                 distribution_pie_fig.savefig(os.path.join(save_path, f"{self.label}_distribution.png"))
+                if latency_histogram_fig:
+                    latency_histogram_fig.savefig(os.path.join(save_path, f"{self.label}_latency.png"))
+                if score_curves_fig:
+                    score_curves_fig.savefig(os.path.join(save_path, f"{self.label}_curves.png"))
+                    threshold_sweep_fig.savefig(os.path.join(save_path, f"{self.label}_threshold_sweep.png"))
                 
                 print(f"\nVisualizations saved to {save_path}")
         
@@ -269,14 +892,18 @@ class EvaluationMetrics:
         
         :param output_dir: Path to the output directory
         """
+        import matplotlib.pyplot as plt
+        
         # Ensure the directory exists
         os.makedirs(output_dir, exist_ok=True)
+        self.flush_details()
         
         # Base filename using the label
         base_filename = os.path.join(output_dir, f"{self.label.replace(' ', '_')}")
         
         # Calculate metrics
         metrics = self.calculate_metrics()
+        latency_metrics = self.calculate_latency_metrics()
         
         # Create data structure for JSON export
         data = {
@@ -285,7 +912,20 @@ class EvaluationMetrics:
             "end_date": self.end_date.isoformat() if self.end_date else None,
             "evaluated_prompts": self.evaluated_prompts,
             "statistics": self.statistics,
+            "details_seen": self.details_seen,
+            "scan_errors": {
+                "count": self.scan_error_count,
+                "details": [str(e) if not isinstance(e, (dict, str)) else e for e in self.scan_errors]
+            },
+            "spill_files": self.spill_files,
             "metrics": metrics,
+            "entity_metrics": self.calculate_entity_metrics(),
+            "unaligned_spans": self.unaligned_span_count,
+            "latency": latency_metrics,
+            "curves": self.calculate_curve_metrics(),
+            "threshold_sweep": {
+                k: v.tolist() for k, v in self.calculate_threshold_sweep().items()
+            } if len(self.scores) > 0 else {},
             "errors": {
                 # Convert complex objects to string representations if needed
                 k: [str(e) if not isinstance(e, (dict, str, int, float, bool, type(None))) else e 
@@ -305,6 +945,8 @@ class EvaluationMetrics:
             f.write("Confusion Matrix Statistics:\n")
             for stat, value in self.statistics.items():
                 f.write(f"{stat.upper()}: {value}\n")
+            if self.scan_error_count:
+                f.write(f"Scan errors: {self.scan_error_count} (not counted above)\n")
             
             f.write("\nPerformance Metrics:\n")
             if metrics:
@@ -314,9 +956,16 @@ class EvaluationMetrics:
                 f.write(f"F1 Score:    {metrics['f1_score']:.4f}\n")
                 f.write(f"Specificity: {metrics.get('specificity', 0):.4f}\n")
             
+            if self.entity_statistics:
+                f.write("\nPer Entity Metrics:\n")
+                for line in self._format_entity_metrics():
+                    f.write(f"{line}\n")
+            if self.unaligned_span_count:
+                f.write(f"Unaligned spans: {self.unaligned_span_count} (ambiguous offsets, counted as FP)\n")
+            
             f.write("\nError Details:\n")
             for error_type, error_list in self.errors.items():
-                f.write(f"{error_type.upper()} Errors ({len(error_list)} entries):\n")
+                f.write(f"{error_type.upper()} Errors ({self._format_details_count(error_type)}):\n")
                 for error in error_list:
                     f.write(f"  - {error}\n")
             
@@ -325,6 +974,16 @@ class EvaluationMetrics:
                 f.write(f"\nEvaluated prompts: {self.evaluated_prompts}\n")
                 f.write(f"Evaluation Duration: {eval_duration}\n")
                 f.write(f"Mean processing time: {eval_duration/self.evaluated_prompts if self.evaluated_prompts else 0}\n")
+            
+            if latency_metrics:
+                f.write(f"\nScan Latency ({latency_metrics['samples']} samples):\n")
+                for line in self._format_latency_metrics(latency_metrics):
+                    f.write(f"{line}\n")
+            
+            if len(self.scores) > 0:
+                f.write(f"\nThreshold Sweep ({len(self.scores)} scored samples):\n")
+                for line in self._format_threshold_sweep():
+                    f.write(f"{line}\n")
         
         # Save visualizations
         try:
@@ -343,6 +1002,22 @@ class EvaluationMetrics:
             pie_fig.savefig(f"{base_filename}_distribution_pie.png", dpi=300, bbox_inches='tight')
             plt.close(pie_fig)
             
+            # Generate and save latency histogram
+            if latency_metrics:
+                latency_fig = self.plot_latency_histogram()
+                latency_fig.savefig(f"{base_filename}_latency_histogram.png", dpi=300, bbox_inches='tight')
+                plt.close(latency_fig)
+            
+            # Generate and save ROC/PR curves and threshold sweep
+            if len(self.scores) > 0:
+                curves_fig = self.plot_score_curves()
+                curves_fig.savefig(f"{base_filename}_curves.png", dpi=300, bbox_inches='tight')
+                plt.close(curves_fig)
+                
+                sweep_fig = self.plot_threshold_sweep()
+                sweep_fig.savefig(f"{base_filename}_threshold_sweep.png", dpi=300, bbox_inches='tight')
+                plt.close(sweep_fig)
+            
         except Exception as e:
             print(f"Error saving visualizations: {e}")
         
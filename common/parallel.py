@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+
+from datasets import Dataset
+
+from common.metrics import EvaluationMetrics
+
+
+def _init_worker(threads_per_worker: int):
+    """Limit the intra-op threads of each worker so the shards don't oversubscribe the CPU"""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "TOKENIZERS_PARALLELISM"):
+        os.environ.setdefault(var, "false" if var == "TOKENIZERS_PARALLELISM" else str(threads_per_worker))
+
+
+def _evaluate_shard(evaluate_fn: Callable[..., EvaluationMetrics], shard: Dataset, args: tuple, kwargs: dict) -> EvaluationMetrics:
+    """Run an evaluator on one shard, inside a worker process"""
+    return evaluate_fn(shard, *args, **kwargs)
+
+
+def _shard_kwargs(kwargs: dict, index: int, num_shards: int) -> dict:
+    """Give each shard its own checkpoint file"""
+    if kwargs.get("checkpoint") is None:
+        return kwargs
+    return {**kwargs, "checkpoint": kwargs["checkpoint"].for_shard(index, num_shards)}
+
+
+def run_sharded(evaluate_fn: Callable[..., EvaluationMetrics], dataset: Dataset, num_workers: int,
+                *args: Any, **kwargs: Any) -> EvaluationMetrics:
+    """
+    Run an evaluator over a dataset split in contiguous shards, one process per shard.
+    
+    Each worker builds its own scanner/guard by calling the evaluator on its shard, and
+    the per-shard metrics are merged back in shard order so the result is deterministic.
+    
+    Args:
+        evaluate_fn: Module level evaluator taking the dataset as first argument
+        dataset: The dataset to evaluate
+        num_workers: Number of worker processes (1 runs the evaluator in this process)
+        *args, **kwargs: Extra arguments given to the evaluator
+        
+    Returns:
+        The merged EvaluationMetrics of all shards
+    """
+    if num_workers <= 1:
+        return evaluate_fn(dataset, *args, **kwargs)
+    if not isinstance(dataset, Dataset):
+        raise ValueError("Sharded evaluation needs a map-style dataset, disable streaming to use num_workers > 1")
+    
+    num_shards = min(num_workers, len(dataset))
+    if num_shards <= 1:
+        return evaluate_fn(dataset, *args, **kwargs)
+    
+    shards = [dataset.shard(num_shards, index, contiguous=True) for index in range(num_shards)]
+    threads_per_worker = max(1, (os.cpu_count() or 1) // num_shards)
+    
+    print(f"Evaluating {len(dataset)} samples in {num_shards} shards...")
+    # Use spawn so no torch / tokenizers state is inherited from the parent process
+    with ProcessPoolExecutor(
+        max_workers=num_shards,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,)
+    ) as executor:
+        futures = [
+            executor.submit(_evaluate_shard, evaluate_fn, shard, args, _shard_kwargs(kwargs, index, num_shards))
+            for index, shard in enumerate(shards)
+        ]
+        shard_metrics = [future.result() for future in futures]
+    
+    return EvaluationMetrics.merge(shard_metrics)
+
+
+def run_isolated(function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a function in a fresh spawned process and return its result.
+
+    Used to compare variants of a scanner run one after the other: each one starts from a clean
+    process, so its memory measurements don't include what the previous variants left allocated.
+
+    Args:
+        function: Module level function to run
+        *args, **kwargs: Arguments of the function
+
+    Returns:
+        The result of the function, which must be picklable
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, *args, **kwargs).result()
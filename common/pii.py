@@ -0,0 +1,413 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+import time
+from typing import Any, Callable, Dict, List, Optional, Pattern, Set
+
+from datasets import Dataset
+
+from common.batching import estimate_tokens
+from common.cache import PredictionCache
+from common.checkpoint import Checkpoint, restore_checkpoint
+from common.comparison import MetricsComparison
+from common.metrics import EvaluationMetrics
+from common.scanners import prepare_scanner, resident_memory
+from common.spans import SPAN_CRITERIA, score_spans
+from utils.datasets import (
+    get_ai4privacy_to_presidio_mapping, dataset_length, decode_privacy_masks, report_progress, select_samples, skip_samples
+)
+
+
+class PIIAdapter:
+    def __init__(self, label: str, build: Callable[[List[str]], Any], scan: Callable[[Any, str], Any],
+                 extract: Callable[[Any], str], redaction_pattern: Pattern, cache_config: Callable[[List[str]], dict],
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        """
+        Initialize the PIIAdapter class, describing how one tool anonymizes a text.
+
+        :param label: Label of the evaluation (e.g. llmguard_pii), also used for the scanner and cache keys
+        :param build: Function building the scanner for the given Presidio entity types
+        :param scan: Function scanning one text with the scanner, its output is what gets cached
+        :param extract: Function returning the sanitized text from the scan output
+        :param redaction_pattern: Compiled regex of a redaction placeholder, its first group being the entity type
+        :param cache_config: Function returning the scanner configuration for the given entity types,
+            used as the prediction cache namespace
+        :param count_tokens: Function returning the token length of a text, used for the token throughput
+        """
+        self.label = label
+        self.build = build
+        self.scan = scan
+        self.extract = extract
+        self.redaction_pattern = redaction_pattern
+        self.cache_config = cache_config
+        self.count_tokens = count_tokens
+
+
+def score_entity_types(metrics: EvaluationMetrics, source_text: str, sanitized_text: str, privacy_masks: List[dict],
+                       entity_mapping: Dict[str, str], entities: Set[str], redaction_pattern: Pattern,
+                       has_relevant_entity: bool = None):
+    """
+    Score one ai4privacy example by comparing the expected and redacted entity types.
+
+    An expected entity is a true positive when an entity of the same Presidio type was redacted,
+    and each redacted entity of an evaluated type that wasn't expected is a false positive.
+
+    Args:
+        metrics: The metrics to update
+        source_text: The original text
+        sanitized_text: The text returned by the scanner
+        privacy_masks: Ground truth masks of the example (label, start, end, value)
+        entity_mapping: Mapping from ai4privacy labels to the evaluated Presidio types
+        entities: Evaluated Presidio entity types
+        redaction_pattern: Regex of the scanner placeholders, its first group being the entity type
+        has_relevant_entity: Whether the example has an evaluated entity, when precomputed
+    """
+    # Filter for entity types we're evaluating
+    if has_relevant_entity is False:
+        relevant_masks = []
+    else:
+        relevant_masks = [mask for mask in privacy_masks if mask["label"] in entity_mapping]
+
+    # If no relevant entities in this example, count as True Negative if nothing detected
+    if not relevant_masks:
+        # True Negative: No PII expected, none detected
+        if sanitized_text == source_text:
+            metrics.increment_statistic("tn")
+        # False Positive: No PII expected, but something detected
+        else:
+            metrics.increment_statistic("fp", details={
+                "text": source_text,
+                "sanitized": sanitized_text,
+                "privacy_mask": privacy_masks,
+                "expected": "No PII"
+            })
+        return
+
+    # Extract the redacted entity types from the sanitized text
+    redacted_entities = redaction_pattern.findall(sanitized_text) if sanitized_text != source_text else []
+    redacted_types = set(redacted_entities)
+
+    # Evaluate each expected PII entity, keeping track of the expected types
+    expected_types = set()
+    for mask in relevant_masks:
+        presidio_type = entity_mapping[mask["label"]]
+        expected_types.add(presidio_type)
+
+        if presidio_type in redacted_types:
+            # True Positive: Expected PII and detected
+            metrics.increment_statistic("tp", details={
+                "entity_type": mask["label"],
+                "value": mask["value"]
+            })
+        else:
+            # False Negative: Expected PII but not detected
+            metrics.increment_statistic("fn", details={
+                "entity_type": mask["label"],
+                "privacy_mask": privacy_masks,
+                "value": mask["value"],
+                "text": source_text,
+                "sanitized": sanitized_text
+            })
+
+    # Redacted entities that weren't expected, only counted for the evaluated entity types
+    for detected_type in redacted_entities:
+        if detected_type not in expected_types and detected_type in entities:
+            metrics.increment_statistic("fp", details={
+                "entity_type": detected_type,
+                "text": source_text,
+                "privacy_mask": privacy_masks,
+                "sanitized": sanitized_text
+            })
+
+
+def _decode_window(window: List[dict]) -> List[tuple]:
+    """Decode the ground truth privacy masks of a window (unless already parsed), skipping examples with an invalid format"""
+    examples = []
+    for example in window:
+        if "privacy_masks" in example:
+            privacy_masks = example["privacy_masks"]
+        else:
+            privacy_masks = decode_privacy_masks(example["privacy_mask"])
+        if privacy_masks is not None:
+            examples.append((example, privacy_masks))
+    return examples
+
+
+def _lookup_cached(cache: Optional[PredictionCache], cache_namespace: str, texts: List[str]) -> tuple:
+    """Return the cached outputs of texts (None when missing), and the indices of the missing texts"""
+    outputs = [None] * len(texts)
+    missing = []
+    for text_idx, text in enumerate(texts):
+        if cache is not None:
+            found, value = cache.get(PredictionCache.key(cache_namespace, text))
+            if found:
+                outputs[text_idx] = value
+                continue
+        missing.append(text_idx)
+    return outputs, missing
+
+
+def _scan_texts(adapter: PIIAdapter, scanner: Any, texts: List[str]) -> tuple:
+    """Scan texts one at a time, returning their outputs, per-text latencies and token count"""
+    outputs = []
+    latencies = []
+    for text in texts:
+        scan_start = time.perf_counter()
+        outputs.append(adapter.scan(scanner, text))
+        latencies.append(time.perf_counter() - scan_start)
+    # The scanners have no batch call, so there is no padding to report
+    return outputs, latencies, sum(adapter.count_tokens(text) for text in texts), None
+
+
+def _store_scanned(metrics: EvaluationMetrics, cache: Optional[PredictionCache], cache_namespace: str,
+                   texts: List[str], outputs: List[Any], missing: List[int], scanned: tuple):
+    """Fill in the outputs of the scanned texts, recording their latencies and tokens, and cache them"""
+    missing_outputs, latencies, tokens, padded_tokens = scanned
+    metrics.record_tokens(tokens, padded_tokens)
+    for text_idx, output, latency in zip(missing, missing_outputs, latencies):
+        outputs[text_idx] = output
+        metrics.record_latency(latency)
+        if cache is not None:
+            cache.set(PredictionCache.key(cache_namespace, texts[text_idx]), output)
+
+
+def _score_window(adapter: PIIAdapter, metrics: EvaluationMetrics, examples: List[tuple], outputs: List[Any],
+                  entity_mapping: Dict[str, str], evaluated_entities: Set[str],
+                  span_criterion: Optional[str], iou_threshold: float):
+    """Extract the sanitized texts and score them in the original order, recording each row prediction"""
+    for (example, privacy_masks), output in zip(examples, outputs):
+        source_text = example["source_text"]
+        metrics.increment_evaluated_prompts()
+        scoring_start = time.perf_counter()
+        sanitized_text = adapter.extract(output)
+        has_relevant_entity = example.get("has_relevant_entity")
+        if span_criterion is not None:
+            score_spans(metrics, source_text, sanitized_text, privacy_masks, entity_mapping, evaluated_entities,
+                        adapter.redaction_pattern, span_criterion, iou_threshold)
+        else:
+            score_entity_types(metrics, source_text, sanitized_text, privacy_masks, entity_mapping,
+                               evaluated_entities, adapter.redaction_pattern, has_relevant_entity)
+        # Row level prediction: was anything redacted, and was there anything to redact
+        if has_relevant_entity is None:
+            has_relevant_entity = any(mask["label"] in entity_mapping for mask in privacy_masks)
+        metrics.record_prediction(sanitized_text != source_text, has_relevant_entity)
+        metrics.record_scoring_time(time.perf_counter() - scoring_start)
+
+
+def evaluate_pii(adapter: PIIAdapter, dataset: Dataset, entities: list[str], sample_size: int = None,
+                 cache: PredictionCache = None, max_details: int = None, spill_dir: str = None,
+                 checkpoint: Checkpoint = None, reuse_scanner: bool = False,
+                 span_criterion: str = None, iou_threshold: float = 0.5) -> EvaluationMetrics:
+    """
+    Evaluate the PII detection of a tool against an ai4privacy ground truth dataset.
+
+    Each example goes through the same pipeline whatever the tool: decode the ground truth masks,
+    scan the text (through the prediction cache), extract the sanitized text and score it. Only
+    the scan is timed as latency, the scoring time is recorded apart. Datasets prepared with
+    utils.datasets.prepare_ai4privacy are scored from their parsed columns, without decoding JSON.
+
+    The scanners (Anonymize, GuardrailsPII) have no batch call, so each text is scanned alone and
+    the token throughput is reported as unbatched.
+
+    Args:
+        adapter: The tool adapter
+        dataset: The ai4privacy/pii-masking-200k dataset
+        entities: List of Presidio entity types to evaluate
+        sample_size: Optional number of samples to evaluate (defaults to entire dataset)
+        cache: Optional prediction cache, to reuse the predictions of previous runs
+        max_details: Optional maximum number of details kept in memory per category
+        spill_dir: Optional directory where the details beyond max_details are written as JSONL
+        checkpoint: Optional checkpoint, to save the progress periodically and resume an interrupted run
+        reuse_scanner: Reuse the scanner built by a previous evaluation in this process
+        span_criterion: Optional span matching criterion ("exact", "overlap" or "iou"), to score the detected
+            spans against the ground truth offsets instead of the detected entity types
+        iou_threshold: Minimum intersection over union of the "iou" span criterion
+
+    Returns:
+        An EvaluationMetrics object with the evaluation results
+    """
+    # Initialize components
+    metrics = EvaluationMetrics(adapter.label, max_details=max_details, spill_dir=spill_dir)
+
+    if span_criterion is not None and span_criterion not in SPAN_CRITERIA:
+        raise ValueError(f"Invalid span criterion: {span_criterion}")
+
+    # Restore the partial metrics of an interrupted run
+    start_position, metrics, finished = restore_checkpoint(checkpoint, metrics)
+    if finished:
+        return metrics
+
+    scanner = prepare_scanner(
+        metrics, (adapter.label, tuple(sorted(entities))), lambda: adapter.build(entities), adapter.scan, reuse_scanner
+    )
+    cache_namespace = PredictionCache.namespace(adapter.label, adapter.cache_config(entities))
+
+    # Get mapping from ai4privacy to Presidio entity types, and the evaluated types as a set
+    entity_mapping = get_ai4privacy_to_presidio_mapping(entities)
+    evaluated_entities = set(entities)
+
+    # Limit the number of examples to process if sample_size is specified
+    dataset_to_process = dataset
+    if sample_size is not None:
+        dataset_to_process = select_samples(dataset, sample_size)
+
+    total_samples = dataset_length(dataset_to_process)
+    rows = iter(skip_samples(dataset_to_process, start_position))
+    idx = start_position
+    # Process the dataset one row at a time
+    while True:
+        if checkpoint is not None:
+            checkpoint.update(idx, metrics)
+
+        window = list(islice(rows, 1))
+        if not window:
+            break
+
+        if idx % 100 == 0:
+            report_progress(idx, total_samples)
+        idx += 1
+
+        examples = _decode_window(window)
+        texts = [example["source_text"] for example, _ in examples]
+
+        # Look up cached predictions, only the missing texts go through the scanner
+        outputs, missing = _lookup_cached(cache, cache_namespace, texts)
+        if missing:
+            scanned = _scan_texts(adapter, scanner, [texts[text_idx] for text_idx in missing])
+            _store_scanned(metrics, cache, cache_namespace, texts, outputs, missing, scanned)
+
+        _score_window(adapter, metrics, examples, outputs, entity_mapping, evaluated_entities,
+                      span_criterion, iou_threshold)
+
+    # Set end time for evaluation duration calculation
+    metrics.end_date = datetime.now()
+    metrics.resident_memory = resident_memory()
+    if checkpoint is not None:
+        checkpoint.save(idx, metrics, finished=True)
+    if cache is not None:
+        print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
+
+    return metrics
+
+
+def compare_pii(adapters: List[PIIAdapter], dataset: Dataset, entities: list[str], sample_size: int = None,
+                cache: PredictionCache = None, max_details: int = None, spill_dir: str = None,
+                reuse_scanner: bool = False, span_criterion: str = None, iou_threshold: float = 0.5,
+                window_size: int = 512, concurrent: bool = True, label: str = "pii_tools") -> MetricsComparison:
+    """
+    Evaluate the PII detection of several tools in a single pass over an ai4privacy dataset.
+
+    Rows are read and their ground truth decoded once per window, then the window is scanned by
+    every tool and scored into the metrics of each tool, as in evaluate_pii. The results are row
+    aligned, so the comparison also gives the per-row agreement of the tools.
+
+    With `concurrent`, the tools scan a window at the same time, one thread each (the models release
+    the GIL during inference), otherwise one after the other. Concurrent scans share the CPU, so their
+    latencies are those of a loaded machine. The prediction cache is only used from the calling thread.
+
+    Args:
+        adapters: The tool adapters, the first one being the baseline of the comparison
+        dataset: The ai4privacy/pii-masking-200k dataset
+        entities: List of Presidio entity types to evaluate
+        sample_size: Optional number of samples to evaluate (defaults to entire dataset)
+        cache: Optional prediction cache, to reuse the predictions of previous runs
+        max_details: Optional maximum number of details kept in memory per category and tool
+        spill_dir: Optional directory where the details beyond max_details are written as JSONL
+        reuse_scanner: Reuse the scanners built by a previous evaluation in this process
+        span_criterion: Optional span matching criterion ("exact", "overlap" or "iou")
+        iou_threshold: Minimum intersection over union of the "iou" span criterion
+        window_size: Number of rows read, decoded and fanned out to the tools together
+        concurrent: Scan each window with the tools in parallel threads
+        label: Label of the comparison
+
+    Returns:
+        A MetricsComparison with the EvaluationMetrics of each tool, by adapter label
+    """
+    if span_criterion is not None and span_criterion not in SPAN_CRITERIA:
+        raise ValueError(f"Invalid span criterion: {span_criterion}")
+
+    metrics = {
+        adapter.label: EvaluationMetrics(adapter.label, max_details=max_details, spill_dir=spill_dir)
+        for adapter in adapters
+    }
+    if len(metrics) != len(adapters):
+        raise ValueError("Compared adapters must have distinct labels")
+
+    # Build every scanner up front, one after the other, so that their memory is measured apart
+    scanners = {
+        adapter.label: prepare_scanner(
+            metrics[adapter.label], (adapter.label, tuple(sorted(entities))), lambda adapter=adapter: adapter.build(entities),
+            adapter.scan, reuse_scanner
+        )
+        for adapter in adapters
+    }
+    cache_namespaces = {
+        adapter.label: PredictionCache.namespace(adapter.label, adapter.cache_config(entities)) for adapter in adapters
+    }
+
+    entity_mapping = get_ai4privacy_to_presidio_mapping(entities)
+    evaluated_entities = set(entities)
+
+    dataset_to_process = dataset
+    if sample_size is not None:
+        dataset_to_process = select_samples(dataset, sample_size)
+
+    # Evaluated texts, row aligned with the predictions, to review the disagreements
+    evaluated_texts = []
+
+    def scan(adapter: PIIAdapter, texts: List[str]) -> tuple:
+        return _scan_texts(adapter, scanners[adapter.label], texts)
+
+    executor = ThreadPoolExecutor(max_workers=len(adapters)) if concurrent else None
+    try:
+        total_samples = dataset_length(dataset_to_process)
+        rows = iter(dataset_to_process)
+        idx = 0
+        while True:
+            window = list(islice(rows, window_size))
+            if not window:
+                break
+
+            if idx % 100 == 0 or idx % 100 + len(window) > 100:
+                report_progress(idx, total_samples)
+            idx += len(window)
+
+            # Decoded once, shared by all the tools
+            examples = _decode_window(window)
+            texts = [example["source_text"] for example, _ in examples]
+            evaluated_texts.extend(texts)
+
+            # Cache lookups, then the scans of every tool (in parallel when concurrent)
+            pending = []
+            for adapter in adapters:
+                outputs, missing = _lookup_cached(cache, cache_namespaces[adapter.label], texts)
+                missing_texts = [texts[text_idx] for text_idx in missing]
+                if not missing:
+                    scanned = None
+                elif executor is not None:
+                    scanned = executor.submit(scan, adapter, missing_texts)
+                else:
+                    scanned = scan(adapter, missing_texts)
+                pending.append((adapter, outputs, missing, scanned))
+
+            for adapter, outputs, missing, scanned in pending:
+                tool_metrics = metrics[adapter.label]
+                if scanned is not None:
+                    if executor is not None:
+                        scanned = scanned.result()
+                    _store_scanned(tool_metrics, cache, cache_namespaces[adapter.label], texts, outputs, missing, scanned)
+                _score_window(adapter, tool_metrics, examples, outputs, entity_mapping, evaluated_entities,
+                              span_criterion, iou_threshold)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    end_date = datetime.now()
+    memory = resident_memory()
+    for tool_metrics in metrics.values():
+        tool_metrics.end_date = end_date
+        tool_metrics.resident_memory = memory
+    if cache is not None:
+        print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
+
+    return MetricsComparison(label, metrics, texts=evaluated_texts)
@@ -0,0 +1,84 @@
+from typing import Any, List, Optional, Tuple
+
+
+def find_models(scanner: Any) -> List[Tuple[Any, str]]:
+    """
+    Find the PyTorch models of a scanner.
+
+    The models are looked up in the scanner attributes, either directly or as the `model` of a
+    transformers pipeline.
+
+    Args:
+        scanner: The scanner (or validator) holding the models
+
+    Returns:
+        (owner, attribute name) of each model, so that it can be read or replaced
+    """
+    import torch
+
+    models = []
+    for name, value in vars(scanner).items():
+        if isinstance(value, torch.nn.Module):
+            models.append((scanner, name))
+        elif isinstance(getattr(value, "model", None), torch.nn.Module):
+            models.append((value, "model"))
+    return models
+
+
+def quantize_models(scanner: Any) -> int:
+    """
+    Replace the PyTorch models of a scanner with int8 dynamically quantized copies, in place.
+
+    Dynamic quantization converts the weights of the Linear layers to int8 and quantizes
+    their activations on the fly, which only runs on CPU.
+
+    Args:
+        scanner: The scanner (or validator) holding the models
+
+    Returns:
+        The number of quantized models
+    """
+    import torch
+
+    models = find_models(scanner)
+    if not models:
+        raise ValueError(f"No PyTorch model found to quantize in {type(scanner).__name__}")
+
+    for owner, name in models:
+        setattr(owner, name, torch.quantization.quantize_dynamic(getattr(owner, name), {torch.nn.Linear}, dtype=torch.qint8))
+    return len(models)
+
+
+def model_weight_bytes(scanner: Any) -> Optional[int]:
+    """
+    Measure the size of the PyTorch model weights of a scanner from their state dicts.
+
+    Unlike a resident memory delta, this doesn't count the full precision weights loaded (and
+    possibly not given back to the system) before quantization, and int8 packed weights count
+    one byte per value.
+
+    Args:
+        scanner: The scanner (or validator) holding the models
+
+    Returns:
+        Bytes of the parameters and buffers of the models, or None without PyTorch or models
+    """
+    try:
+        import torch
+        models = find_models(scanner)
+    except ImportError:
+        return None
+    if not models:
+        return None
+
+    def tensor_bytes(value: Any) -> int:
+        # Quantized Linear layers keep their weights as a packed (weight, bias) tuple
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(tensor_bytes(item) for item in value)
+        return 0
+
+    return sum(
+        tensor_bytes(value) for owner, name in models for value in getattr(owner, name).state_dict().values()
+    )
@@ -0,0 +1,231 @@
+import time
+from array import array
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from common.batching import estimate_tokens
+from common.scanners import WARMUP_TEXT, resident_memory
+
+# Input sizes in tokens, from short prompts to long RAG contexts
+DEFAULT_SIZES = [20, 64, 128, 256, 512, 1024, 2048, 4096, 8192]
+
+
+def build_length_inputs(texts: List[str], sizes: List[int], variants: int = 3,
+                        count_tokens: Callable[[str], int] = estimate_tokens) -> Dict[int, List[str]]:
+    """
+    Build inputs of controlled token lengths from dataset texts.
+
+    Each input concatenates consecutive texts (cycling over them) until it reaches the size, then
+    is truncated to the longest word prefix that fits. Variants start from different texts, so a
+    size isn't measured on a single input.
+
+    Args:
+        texts: Dataset texts
+        sizes: Target sizes in tokens
+        variants: Number of inputs per size
+        count_tokens: Function returning the token length of a text
+
+    Returns:
+        The inputs of each size
+    """
+    words = [text.split() for text in texts if text.strip()]
+    if not words:
+        raise ValueError("No text to build the inputs from")
+
+    inputs = {}
+    for size in sizes:
+        inputs[size] = []
+        for variant in range(variants):
+            # Concatenate texts until the size is reached
+            input_words = []
+            idx = variant * len(words) // variants
+            while count_tokens(" ".join(input_words)) < size and len(input_words) < size * 4:
+                input_words.extend(words[idx % len(words)])
+                idx += 1
+            # Truncate to the longest prefix within the size
+            low, high = 1, len(input_words)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if count_tokens(" ".join(input_words[:middle])) <= size:
+                    low = middle
+                else:
+                    high = middle - 1
+            inputs[size].append(" ".join(input_words[:low]))
+    return inputs
+
+
+class ScalingResult:
+    def __init__(self, label: str):
+        """
+        Initialize the ScalingResult class.
+
+        :param label: Label of the measured scanner
+        """
+        self.label = label
+        self.errors = 0
+
+        # Per-scan input size (in tokens) and latency (in seconds)
+        self.tokens = array("d")
+        self.latencies = array("d")
+        # Resident memory growth over the baseline, in bytes, once the inputs up to each size were scanned
+        self.memory = {}
+
+    def calculate_metrics(self):
+        """
+        Calculate the latency and memory metrics of each input size.
+
+        :return: Dictionary of metrics by size (latencies in seconds, memory in MB)
+        """
+        tokens = np.array(self.tokens, dtype=np.float64)
+        latencies = np.array(self.latencies, dtype=np.float64)
+        metrics = {}
+        for size in sorted(set(self.tokens)):
+            size_latencies = latencies[tokens == size]
+            p50 = float(np.percentile(size_latencies, 50))
+            metrics[int(size)] = {
+                "scans": len(size_latencies),
+                "p50": p50,
+                "p99": float(np.percentile(size_latencies, 99)),
+                "tokens_per_second": size / p50 if p50 > 0 else 0,
+                "memory_mb": self.memory[int(size)] / (1024 ** 2) if self.memory.get(int(size)) is not None else None
+            }
+        return metrics
+
+    def fit_growth(self):
+        """
+        Fit the growth of the median latency with the input size.
+
+        The linear fit splits latency into a fixed cost and a cost per token, the power law fit
+        (a straight line in log-log) gives the growth exponent: about 1 for a linear scanner,
+        2 for one dominated by full attention, under 1 when inputs are truncated (or while a fixed
+        cost dominates the small sizes).
+
+        :return: Dictionary of the linear (intercept, slope, r2) and power law (coefficient, exponent, r2) fits
+        """
+        metrics = self.calculate_metrics()
+        if len(metrics) < 2:
+            return {}
+
+        sizes = np.array(list(metrics), dtype=np.float64)
+        p50 = np.array([m["p50"] for m in metrics.values()], dtype=np.float64)
+
+        def r2(observed, fitted):
+            total = np.sum((observed - observed.mean()) ** 2)
+            return float(1 - np.sum((observed - fitted) ** 2) / total) if total > 0 else 1.0
+
+        slope, intercept = np.polyfit(sizes, p50, 1)
+        fits = {"linear": {"intercept": float(intercept), "slope": float(slope),
+                           "r2": r2(p50, intercept + slope * sizes)}}
+        if np.all(p50 > 0):
+            exponent, log_coefficient = np.polyfit(np.log(sizes), np.log(p50), 1)
+            fits["power"] = {"coefficient": float(np.exp(log_coefficient)), "exponent": float(exponent),
+                             "r2": r2(np.log(p50), log_coefficient + exponent * np.log(sizes))}
+        return fits
+
+
+def run_scaling(label: str, scan: Callable[[str], Any], inputs: Dict[int, List[str]], repeats: int = 3) -> ScalingResult:
+    """
+    Measure the latency and memory of a scanner for each input size.
+
+    Sizes are scanned in increasing order, each input `repeats` times, after one warmup scan. The
+    memory of a size is the resident memory growth over the baseline taken after the warmup, so it
+    is the peak working set of the inputs up to that size (freed memory is rarely given back).
+
+    Args:
+        label: Label of the measured scanner
+        scan: Function scanning one text
+        inputs: Inputs of each size, from build_length_inputs
+        repeats: Number of scans of each input
+
+    Returns:
+        A ScalingResult with the per-scan latencies and the memory of each size
+    """
+    result = ScalingResult(label)
+    try:
+        scan(WARMUP_TEXT)
+    except Exception:
+        pass
+    baseline = resident_memory()
+
+    for size in sorted(inputs):
+        print(f"Measuring {label} with {size} token inputs...")
+        for text in inputs[size]:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                try:
+                    scan(text)
+                except Exception:
+                    result.errors += 1
+                    continue
+                result.tokens.append(size)
+                result.latencies.append(time.perf_counter() - start)
+        current = resident_memory()
+        result.memory[size] = max(0, current - baseline) if current is not None and baseline is not None else None
+
+    return result
+
+
+def display_scaling(results: List[ScalingResult], save_path: str = None):
+    """
+    Display the latency and memory of each scanner by input size, with the fitted growth curves.
+
+    :param results: Scaling results, one per scanner
+    :param save_path: Optional path to save the plot
+    """
+    import matplotlib.pyplot as plt
+
+    print("Input Length Scaling")
+    print("=" * 40)
+    rows = []
+    for result in results:
+        metrics = result.calculate_metrics()
+        if not metrics:
+            continue
+        fits = result.fit_growth()
+        rows.append((result, metrics, fits))
+        print(f"{result.label} ({result.errors} errors)")
+        print("Tokens  p50 (ms)   p99 (ms)   Tokens/s    Memory (MB)")
+        for size, m in metrics.items():
+            memory = f"{m['memory_mb']:.1f}" if m["memory_mb"] is not None else "n/a"
+            print(f"{size:<6d}  {m['p50'] * 1000:<9.2f}  {m['p99'] * 1000:<9.2f}  {m['tokens_per_second']:<10.1f}  {memory}")
+        if "linear" in fits:
+            print(f"Linear fit: {fits['linear']['intercept'] * 1000:.2f} ms + "
+                  f"{fits['linear']['slope'] * 1e6:.2f} µs/token (R² {fits['linear']['r2']:.3f})")
+        if "power" in fits:
+            print(f"Power law fit: latency ∝ tokens^{fits['power']['exponent']:.2f} (R² {fits['power']['r2']:.3f})")
+        print()
+
+    if not rows:
+        return
+
+    fig, axes = plt.subplots(1, len(rows), figsize=(7 * len(rows), 6), squeeze=False)
+    for ax, (result, metrics, fits) in zip(axes[0], rows):
+        sizes = np.array(list(metrics), dtype=np.float64)
+        ax.plot(sizes, [m["p50"] * 1000 for m in metrics.values()], marker='o', color='#4CAF50', label='p50')
+        ax.plot(sizes, [m["p99"] * 1000 for m in metrics.values()], marker='o', color='#F44336', label='p99')
+        if "power" in fits:
+            curve = np.geomspace(sizes.min(), sizes.max(), 100)
+            ax.plot(curve, fits["power"]["coefficient"] * curve ** fits["power"]["exponent"] * 1000, linestyle='--',
+                    color='#2196F3', label=f"fit ∝ n^{fits['power']['exponent']:.2f}")
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel('Input tokens')
+        ax.set_ylabel('Milliseconds')
+        ax.set_title(f'Latency by Input Length for {result.label}')
+        ax.legend(loc='upper left')
+
+        memory = [(size, m["memory_mb"]) for size, m in metrics.items() if m["memory_mb"] is not None]
+        if memory:
+            memory_ax = ax.twinx()
+            memory_ax.plot([size for size, _ in memory], [mb for _, mb in memory], marker='s', color='#FF9800',
+                           alpha=0.6, label='memory')
+            memory_ax.set_ylabel('Resident memory growth (MB)')
+            memory_ax.legend(loc='lower right')
+
+    plt.tight_layout()
+    plt.show()
+
+    if save_path:
+        fig.savefig(save_path, dpi=300, bbox_inches='tight')
+        print(f"\nScaling plot saved to {save_path}")
@@ -0,0 +1,92 @@
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from common.metrics import EvaluationMetrics
+
+# Text scanned once after a scanner is built, to measure its first-call (warmup) cost
+WARMUP_TEXT = "Hello, my name is John Doe and you can reach me at john.doe@example.com."
+
+# Scanners kept alive across bench calls of this process, by configuration key
+_scanners: Dict[Hashable, Any] = {}
+
+
+def resident_memory() -> Optional[int]:
+    """Return the resident set size of this process in bytes, or None when it can't be read"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        # Linux fallback: the second field of statm is the resident size in pages
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def get_scanner(key: Hashable, build: Callable[[], Any], reuse: bool = False) -> Tuple[Any, Optional[float]]:
+    """
+    Build a scanner, or reuse the one already built in this process for the same configuration.
+    
+    Args:
+        key: Configuration of the scanner (tool, model, threshold, entities...)
+        build: Function building the scanner
+        reuse: Whether to keep the scanner for, and take it from, previous calls
+        
+    Returns:
+        The scanner and its load time in seconds (None when an already built scanner is reused)
+    """
+    if reuse and key in _scanners:
+        return _scanners[key], None
+    
+    load_start = time.perf_counter()
+    scanner = build()
+    load_time = time.perf_counter() - load_start
+    
+    if reuse:
+        _scanners[key] = scanner
+    return scanner, load_time
+
+
+def clear_scanners():
+    """Release the scanners kept for reuse"""
+    _scanners.clear()
+
+
+def prepare_scanner(metrics: EvaluationMetrics, key: Hashable, build: Callable[[], Any],
+                    scan: Callable[[Any, str], Any], reuse: bool = False) -> Any:
+    """
+    Get a scanner for an evaluation, recording its cold-start cost apart from the steady-state metrics.
+    
+    A freshly built scanner is warmed up with one scan of WARMUP_TEXT. The load time, the memory
+    taken by the model and the warmup latency are stored on the metrics, and the evaluation start date is pushed back by
+    the time they took so the evaluation duration and throughput only cover steady-state scans.
+    
+    Args:
+        metrics: The metrics of the evaluation
+        key: Configuration of the scanner
+        build: Function building the scanner
+        scan: Function scanning a text with the scanner
+        reuse: Whether to reuse a scanner built by a previous call in this process
+        
+    Returns:
+        The ready to use scanner
+    """
+    setup_start = datetime.now()
+    memory_before = resident_memory()
+    scanner, load_time = get_scanner(key, build, reuse)
+    
+    if load_time is not None:
+        metrics.model_load_time = load_time
+        memory_after = resident_memory()
+        if memory_before is not None and memory_after is not None:
+            metrics.model_memory = memory_after - memory_before
+        warmup_start = time.perf_counter()
+        scan(scanner, WARMUP_TEXT)
+        metrics.warmup_latency = time.perf_counter() - warmup_start
+    
+    metrics.start_date += datetime.now() - setup_start
+    return scanner
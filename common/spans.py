@@ -0,0 +1,211 @@
+from typing import Dict, List, Pattern, Tuple
+
+from common.metrics import EvaluationMetrics
+
+# (start, end, entity type) with end excluded, like Python slices and ai4privacy offsets
+Span = Tuple[int, int, str]
+
+SPAN_CRITERIA = ("exact", "overlap", "iou")
+
+
+def align_redactions(source_text: str, sanitized_text: str,
+                     redaction_pattern: Pattern) -> Tuple[List[Span], List[str]]:
+    """
+    Recover the source spans replaced by redaction placeholders in a sanitized text.
+
+    The sanitized text is split into literal segments and placeholders: the source text between
+    two literals is the span of the placeholder(s) between them. Adjacent placeholders can't be
+    told apart, they all get the whole chunk.
+
+    A literal can occur several times in the source (e.g. the single space of "[PERSON] [PERSON]"
+    over "John Smith Jane Doe"), so the placeholders around it could be split at several points.
+    The literals are placed both at their earliest (forward scan) and at their latest (backward
+    scan) possible position: where both alignments agree the span is certain, elsewhere the
+    placeholders are returned as unaligned instead of guessing a split. Each scan only moves in
+    one direction, so alignment is linear in practice.
+
+    Args:
+        source_text: The original text
+        sanitized_text: The text returned by the scanner
+        redaction_pattern: Regex of a placeholder, its first group being the entity type
+
+    Returns:
+        (spans, unaligned): the aligned spans in source order, and the entity types of the
+        placeholders that couldn't be aligned
+    """
+    placeholders = list(redaction_pattern.finditer(sanitized_text))
+    if not placeholders:
+        return [], []
+
+    # Literal text before, between and after the placeholders
+    literals = [sanitized_text[:placeholders[0].start()]]
+    for current, following in zip(placeholders, placeholders[1:]):
+        literals.append(sanitized_text[current.end():following.start()])
+    literals.append(sanitized_text[placeholders[-1].end():])
+
+    # Groups of adjacent placeholders, each followed by a non empty literal (or by the last literal)
+    groups = []
+    pending_types = []
+    for index, placeholder in enumerate(placeholders):
+        pending_types.append(placeholder.group(1))
+        if literals[index + 1] != "" or index == len(placeholders) - 1:
+            groups.append((pending_types, literals[index + 1]))
+            pending_types = []
+
+    first, last = literals[0], literals[-1]
+    if not source_text.startswith(first) or not source_text.endswith(last):
+        # The sanitized text doesn't line up with the source
+        return [], [placeholder.group(1) for placeholder in placeholders]
+
+    # Earliest start of each group's literal, each placeholder covering at least one character
+    earliest = []
+    position = len(first)
+    for _, literal in groups[:-1]:
+        start = source_text.find(literal, position + 1)
+        if start < 0:
+            return [], [placeholder.group(1) for placeholder in placeholders]
+        earliest.append(start)
+        position = start + len(literal)
+    if len(source_text) - len(last) < position + 1:
+        return [], [placeholder.group(1) for placeholder in placeholders]
+    earliest.append(len(source_text) - len(last))
+
+    # Latest start of each group's literal, scanning back from the end of the source
+    latest = [len(source_text) - len(last)]
+    for _, literal in reversed(groups[:-1]):
+        latest.append(source_text.rfind(literal, 0, latest[-1] - 1))
+    latest.reverse()
+
+    spans = []
+    unaligned = []
+    earliest_position = latest_position = len(first)
+    for (entity_types, literal), earliest_end, latest_end in zip(groups, earliest, latest):
+        if earliest_position == latest_position and earliest_end == latest_end:
+            spans.extend((earliest_position, earliest_end, entity_type) for entity_type in entity_types)
+        else:
+            unaligned.extend(entity_types)
+        earliest_position = earliest_end + len(literal)
+        latest_position = latest_end + len(literal)
+
+    return spans, unaligned
+
+
+def _overlap(a: Span, b: Span) -> int:
+    return min(a[1], b[1]) - max(a[0], b[0])
+
+
+def _iou(a: Span, b: Span) -> float:
+    union = max(a[1], b[1]) - min(a[0], b[0])
+    return _overlap(a, b) / union if union > 0 else 0
+
+
+def match_spans(predicted: List[Span], expected: List[Span], criterion: str = "overlap",
+                iou_threshold: float = 0.5) -> Dict[str, Dict[str, int]]:
+    """
+    Match predicted spans to ground truth spans of the same entity type, one to one.
+
+    Both lists are sorted by start and swept together: a predicted span stays active while
+    it can still overlap the next expected spans, and each expected span takes the best
+    (highest IoU) unmatched active span meeting the criterion. Sorting dominates, so matching
+    is O(n log n) for the usual few overlapping spans per position.
+
+    Args:
+        predicted: Detected spans
+        expected: Ground truth spans
+        criterion: "exact" (same offsets), "overlap" (at least one shared character) or "iou"
+        iou_threshold: Minimum intersection over union for the "iou" criterion
+
+    Returns:
+        Per entity type counts of tp, fp and fn
+    """
+    if criterion not in SPAN_CRITERIA:
+        raise ValueError(f"Invalid span criterion: {criterion}")
+
+    predicted = sorted(predicted)
+    expected = sorted(expected)
+    counts: Dict[str, Dict[str, int]] = {}
+
+    def count(entity_type: str, stat_type: str):
+        counts.setdefault(entity_type, {"tp": 0, "fp": 0, "fn": 0})[stat_type] += 1
+
+    def matches(p: Span, e: Span) -> bool:
+        if criterion == "exact":
+            return p[0] == e[0] and p[1] == e[1]
+        if criterion == "overlap":
+            return _overlap(p, e) > 0
+        return _iou(p, e) >= iou_threshold
+
+    matched = [False] * len(predicted)
+    active: List[int] = []
+    next_predicted = 0
+    for e in expected:
+        # Activate the predicted spans starting before this expected span ends
+        while next_predicted < len(predicted) and predicted[next_predicted][0] < e[1]:
+            active.append(next_predicted)
+            next_predicted += 1
+        # Retire the ones ending before it starts, they can't match any later span either
+        active = [i for i in active if not matched[i] and predicted[i][1] > e[0]]
+
+        candidates = [i for i in active if predicted[i][2] == e[2] and matches(predicted[i], e)]
+        if candidates:
+            best = max(candidates, key=lambda i: _iou(predicted[i], e))
+            matched[best] = True
+            count(e[2], "tp")
+        else:
+            count(e[2], "fn")
+
+    for i, p in enumerate(predicted):
+        if not matched[i]:
+            count(p[2], "fp")
+
+    return counts
+
+
+def score_spans(metrics: EvaluationMetrics, source_text: str, sanitized_text: str, privacy_masks: List[dict],
+                entity_mapping: Dict[str, str], entities: List[str], redaction_pattern: Pattern,
+                criterion: str = "overlap", iou_threshold: float = 0.5):
+    """
+    Score one ai4privacy example at span level and update the metrics.
+
+    Args:
+        metrics: The metrics to update
+        source_text: The original text
+        sanitized_text: The text returned by the scanner
+        privacy_masks: Ground truth masks of the example (label, start, end, value)
+        entity_mapping: Mapping from ai4privacy labels to the evaluated Presidio types
+        entities: Evaluated Presidio entity types
+        redaction_pattern: Regex of the scanner placeholders, its first group being the entity type
+        criterion: Span matching criterion ("exact", "overlap" or "iou")
+        iou_threshold: Minimum intersection over union for the "iou" criterion
+    """
+    expected = [
+        (mask["start"], mask["end"], entity_mapping[mask["label"]])
+        for mask in privacy_masks if mask["label"] in entity_mapping
+    ]
+    aligned, unaligned = align_redactions(source_text, sanitized_text, redaction_pattern)
+    predicted = [span for span in aligned if span[2] in entities]
+    unaligned = [entity_type for entity_type in unaligned if entity_type in entities]
+    metrics.unaligned_span_count += len(unaligned)
+
+    # Nothing expected nor detected
+    if not expected and not predicted and not unaligned:
+        metrics.increment_statistic("tn")
+        return
+
+    counts = match_spans(predicted, expected, criterion, iou_threshold)
+    # Placeholders without a certain span can't be matched: each one is a false positive,
+    # and the spans it may cover count as missed
+    for entity_type in unaligned:
+        counts.setdefault(entity_type, {"tp": 0, "fp": 0, "fn": 0})["fp"] += 1
+    for entity_type, entity_counts in counts.items():
+        for stat_type, value in entity_counts.items():
+            if value == 0:
+                continue
+            metrics.increment_entity_statistic(entity_type, stat_type, value)
+            details = {
+                "entity_type": entity_type,
+                "text": source_text,
+                "sanitized": sanitized_text
+            }
+            for _ in range(value):
+                metrics.increment_statistic(stat_type, details=details)
@@ -0,0 +1,108 @@
+"""
+Headless benchmark runner.
+
+Usage: python -m tools <config.json|config.toml> [--only llmguard.pii ...] [--output-dir results]
+
+The config file lists the benchmarks to run, each entry giving the tool, the benchmark
+and the keyword arguments of the matching bench_* function:
+
+    {
+        "output_dir": "results",
+        "benchmarks": [
+            {"tool": "llmguard", "benchmark": "toxicity", "dataset": "maartensap/ToxicityPrompts",
+             "split": "full", "max_split_size": 1000, "subset": "ptp-fr", "threshold": 0.7}
+        ]
+    }
+
+Heavy dependencies (llm_guard, guardrails, torch, matplotlib) are only imported by the
+benchmarks that need them, and their import time is reported as the startup phase.
+"""
+import time
+
+_process_start = time.perf_counter()
+
+import argparse
+import importlib
+import json
+import os
+import sys
+
+# (benchmark module, bench function, scanner module loaded by the bench function)
+BENCHMARKS = {
+    "llmguard.pii": ("tools.llmguard.benchmarks", "bench_pii", "tools.llmguard.input_scanners.pii"),
+    "llmguard.toxicity": ("tools.llmguard.benchmarks", "bench_toxicity", "tools.llmguard.input_scanners.toxicity"),
+    "llmguard.pii_backends": ("tools.llmguard.benchmarks", "bench_pii_backends", "tools.llmguard.input_scanners.pii"),
+    "llmguard.toxicity_backends": (
+        "tools.llmguard.benchmarks", "bench_toxicity_backends", "tools.llmguard.input_scanners.toxicity"
+    ),
+    "guardrails.pii": ("tools.guardrails.benchmarks", "bench_pii", "tools.guardrails.validators.pii"),
+    "guardrails.jailbreak": ("tools.guardrails.benchmarks", "bench_jailbreak", "tools.guardrails.validators.jailbreak"),
+    "llmguard.toxicity_quantization": (
+        "tools.llmguard.benchmarks", "bench_toxicity_quantization", "tools.llmguard.input_scanners.toxicity"
+    ),
+    "guardrails.jailbreak_quantization": (
+        "tools.guardrails.benchmarks", "bench_jailbreak_quantization", "tools.guardrails.validators.jailbreak"
+    ),
+    # The compared tools are only known from the config entry, their modules are loaded by the bench function
+    "compare.pii": ("tools.benchmarks", "bench_pii_tools", "common.pii"),
+}
+
+
+def load_config(path: str) -> dict:
+    """Load a JSON or TOML benchmark config file"""
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_benchmark(entry: dict, output_dir: str):
+    """Import, run and save one benchmark of the config file"""
+    kwargs = dict(entry)
+    name = f"{kwargs.pop('tool')}.{kwargs.pop('benchmark')}"
+    if name not in BENCHMARKS:
+        raise ValueError(f"Unknown benchmark '{name}', expected one of {', '.join(BENCHMARKS)}")
+    module_name, function_name, scanner_module_name = BENCHMARKS[name]
+
+    print(f"\n[{name}] Startup...")
+    startup_start = time.perf_counter()
+    bench_function = getattr(importlib.import_module(module_name), function_name)
+    importlib.import_module(scanner_module_name)
+    print(f"[{name}] Startup: {time.perf_counter() - startup_start:.2f}s")
+
+    run_start = time.perf_counter()
+    # EvaluationMetrics, or MetricsComparison for the compare.* and the *_backends and *_quantization benchmarks
+    metrics = bench_function(**kwargs)
+    print(f"[{name}] Benchmark: {time.perf_counter() - run_start:.2f}s")
+
+    report_start = time.perf_counter()
+    metrics.save_to_file(output_dir)
+    print(f"[{name}] Report: {time.perf_counter() - report_start:.2f}s")
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m tools", description="Run LLM Sec tools benchmarks headlessly")
+    parser.add_argument("config", help="JSON or TOML file listing the benchmarks to run")
+    parser.add_argument("--only", nargs="+", default=None, help="Only run these benchmarks (e.g. llmguard.pii)")
+    parser.add_argument("--output-dir", default=None, help="Where to save the metrics (overrides the config)")
+    args = parser.parse_args(argv)
+
+    # No display in batch jobs, figures are only saved
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+    config = load_config(args.config)
+    output_dir = args.output_dir or config.get("output_dir", "results")
+    entries = [
+        entry for entry in config["benchmarks"]
+        if args.only is None or f"{entry['tool']}.{entry['benchmark']}" in args.only
+    ]
+    print(f"Runner startup: {time.perf_counter() - _process_start:.2f}s, {len(entries)} benchmark(s) to run")
+
+    for entry in entries:
+        run_benchmark(entry, output_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
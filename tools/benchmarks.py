@@ -0,0 +1,45 @@
+import importlib
+
+from common.cache import PredictionCache
+from common.comparison import MetricsComparison
+from utils.datasets import load_dataset, select_samples, prepare_ai4privacy
+
+# PII adapter of each tool, imported by the comparison only for the compared tools
+PII_ADAPTERS = {
+    "llmguard": ("tools.llmguard.input_scanners.pii", "ADAPTER"),
+    "llmguard_onnx": ("tools.llmguard.input_scanners.pii", "ONNX_ADAPTER"),
+    "guardrails": ("tools.guardrails.validators.pii", "ADAPTER"),
+}
+
+
+def bench_pii_tools(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+                    tools: list[str] = ["llmguard", "guardrails"], streaming: bool = False, cache_path: str = None,
+                    max_details: int = None, spill_dir: str = None, reuse_scanner: bool = False,
+                    span_criterion: str = None, iou_threshold: float = 0.5, num_proc: int = None,
+                    window_size: int = 512, concurrent: bool = True) -> MetricsComparison:
+    """Run the PII benchmark of several tools over a single load of the dataset and compare them row by row"""
+    from common.pii import compare_pii
+
+    unknown_tools = [tool for tool in tools if tool not in PII_ADAPTERS]
+    if unknown_tools:
+        raise ValueError(f"Unknown PII tools {', '.join(unknown_tools)}, expected some of {', '.join(PII_ADAPTERS)}")
+    adapters = [
+        getattr(importlib.import_module(module_name), adapter_name)
+        for module_name, adapter_name in (PII_ADAPTERS[tool] for tool in tools)
+    ]
+
+    cache = PredictionCache(cache_path) if cache_path else None
+    print(f"Preparing dataset for PII Comparison...")
+    dataset = load_dataset(dataset, split, streaming=streaming)
+    dataset = select_samples(dataset, max_split_size, preferred_language, num_proc=num_proc)
+    dataset = prepare_ai4privacy(dataset, entities, num_proc=num_proc)
+    print(f"Running PII Comparison of {', '.join(tools)}...")
+
+    comparison = compare_pii(
+        adapters, dataset, entities, cache=cache, max_details=max_details, spill_dir=spill_dir,
+        reuse_scanner=reuse_scanner, span_criterion=span_criterion, iou_threshold=iou_threshold,
+        window_size=window_size,
+        concurrent=concurrent, label=f"{'_vs_'.join(tools)}_pii"
+    )
+    print(f"Finished PII Comparison!")
+    return comparison
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from datasets import load_from_disk
+
+from generate_ds import ShardWriter, generate, save_dataset
+
+# Sentence returned by the stub server, with the placeholders the model sometimes leaves
+STUB_RESPONSE = "Appelez [PERSON] au [PHONE_NUMBER] avant demain."
+
+
+class StubOllamaServer:
+    def __init__(self, fail_every: int = 0, truncate_every: int = 0):
+        """
+        Initialize the StubOllamaServer class, answering /api/generate like Ollama on a free local port.
+
+        :param fail_every: Answer every n-th request with an HTTP 500 error (0 never fails, 1 always fails)
+        :param truncate_every: Cut the body of every n-th request short, raising IncompleteRead in the client
+        """
+        self.requests = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    stub.requests += 1
+                    request = stub.requests
+                if fail_every and request % fail_every == 0:
+                    self.send_error(500, "Stub failure")
+                    return
+                body = json.dumps({"response": STUB_RESPONSE}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if truncate_every and request % truncate_every == 0:
+                    # Announce more bytes than sent, then close the connection
+                    self.send_header("Content-Length", str(len(body) + 10))
+                    self.end_headers()
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def check_flaky_server(n_samples: int, shard_size: int):
+    """Requests failing now and then are retried, and the records are read back with load_from_disk"""
+    with tempfile.TemporaryDirectory() as tmp_dir, StubOllamaServer(fail_every=5, truncate_every=7) as server:
+        writer = ShardWriter(os.path.join(tmp_dir, "shards"), shard_size)
+        stats = asyncio.run(generate(n_samples, writer, base_url=server.url, concurrency=4, max_retries=3))
+        assert stats["generated"] + stats["failed"] == n_samples, stats
+        assert stats["generated"] > 0, stats
+        assert server.requests > n_samples, "No request was retried"
+
+        total = save_dataset(writer.output_dir, os.path.join(tmp_dir, "PII_dataset"))
+        dataset = load_from_disk(os.path.join(tmp_dir, "PII_dataset"))
+        assert total == len(dataset) == stats["generated"], (total, len(dataset), stats)
+        assert "[PERSON]" not in dataset[0]["raw_text"] and "<PERSON>" in dataset[0]["masked_text"], dataset[0]
+        print(f"Flaky server: {stats['generated']} generated, {stats['failed']} failed, "
+              f"{server.requests} requests, {len(dataset)} rows read back")
+
+
+def check_failing_server(n_samples: int):
+    """Records whose every attempt fails are dropped without aborting the run"""
+    with tempfile.TemporaryDirectory() as tmp_dir, StubOllamaServer(fail_every=1) as server:
+        writer = ShardWriter(os.path.join(tmp_dir, "shards"))
+        stats = asyncio.run(generate(n_samples, writer, base_url=server.url, concurrency=2, max_retries=1))
+        assert stats == {**stats, "generated": 0, "failed": n_samples}, stats
+        assert server.requests == n_samples * 2, server.requests
+        assert save_dataset(writer.output_dir, os.path.join(tmp_dir, "PII_dataset")) == 0
+        print(f"Failing server: {stats['failed']} failed after {server.requests} requests")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check generate_ds.py retries and output against a stub Ollama server")
+    parser.add_argument("--n-samples", type=int, default=25)
+    parser.add_argument("--shard-size", type=int, default=10)
+    args = parser.parse_args()
+    check_flaky_server(args.n_samples, args.shard_size)
+    check_failing_server(3)
+    print("All generate_ds checks passed")
@@ -1,19 +1,23 @@
-import uuid
+import argparse
+import asyncio
+import glob
+import http.client
 import json
-import pandas as pd
+import os
+import time
+import urllib.error
+import urllib.request
+import uuid
 
-from langchain import LLMChain, PromptTemplate
-from langchain_community.llms import Ollama
+import pyarrow as pa
 
 from pii_utils import sample_pii, mask_entities
-from datasets import Dataset
 
-def main(n_samples: int = 10):
-    # 1) Initialize your local Ollama model (make sure it's running: `ollama serve`)
-    llm = Ollama(model="llama3.2")  
+# Local Ollama server (make sure it's running: `ollama serve`)
+OLLAMA_URL = "http://localhost:11434"
 
-    # 2) Prompt with placeholders
-    template = """
+# Prompt with placeholders
+PROMPT_TEMPLATE = """
 SYSTEM:
 Vous êtes **GenSynth**, un générateur de données **100 % fictives** fournies par Faker. Votre tâche est d'insérer des informations **fictives** dans une phrase naturelle en français. Ces données simulées servent à tester des solutions d'identification de PII. Toutes les informations ne sont pas réelles.
 
@@ -42,45 +46,248 @@ Rappelez-vous : votre unique mission est de générer une **phrase originale** e
 USER: Donne moi une phrase avec les informations **100% FICTIVES** si dessus en respectant les instructions
 GenSynth :
 """
-    prompt = PromptTemplate(
-        template=template,
-        input_variables=list(sample_pii().keys())
+
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("raw_text", pa.string()),
+    ("masked_text", pa.string()),
+    ("entities", pa.string()),
+    ("locale", pa.string()),
+    ("source", pa.string()),
+])
+
+
+class ShardWriter:
+    def __init__(self, output_dir: str, shard_size: int = 1000):
+        """
+        Initialize the ShardWriter class, writing records to Arrow shards as they arrive.
+
+        Only the records of the current shard are kept in memory. Shards are written under a
+        temporary name and renamed once complete, and numbering continues after the shards already
+        in the directory, so an interrupted generation keeps its finished shards. The shards load with
+        `datasets.load_dataset("arrow", data_files=f"{output_dir}/*.arrow")`, or `save_dataset` turns
+        them into a `load_from_disk` dataset.
+
+        A full shard is handed off by `add` and written by `write`, so the caller can run the file
+        I/O in a thread while records keep arriving.
+
+        :param output_dir: Directory of the shards
+        :param shard_size: Number of records per shard
+        """
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        os.makedirs(output_dir, exist_ok=True)
+        self.shard_index = len(glob.glob(os.path.join(output_dir, "shard-*.arrow")))
+        self.records = []
+        self.written = 0
+
+    def add(self, record: dict):
+        """
+        Buffer a record.
+
+        :return: (path, records) of the shard to write once the buffer is full, None otherwise
+        """
+        self.records.append(record)
+        if len(self.records) >= self.shard_size:
+            return self.take()
+        return None
+
+    def take(self):
+        """
+        Hand off the pending records with the path of their shard, and start a new buffer.
+
+        :return: (path, records), or None when no record is pending
+        """
+        if not self.records:
+            return None
+        path = os.path.join(self.output_dir, f"shard-{self.shard_index:05d}.arrow")
+        records, self.records = self.records, []
+        self.shard_index += 1
+        self.written += len(records)
+        return path, records
+
+    def write(self, path: str, records: list):
+        """Write records as the shard at path"""
+        table = pa.Table.from_pylist(records, schema=SCHEMA)
+        with pa.OSFile(f"{path}.tmp", "wb") as sink, pa.ipc.new_stream(sink, SCHEMA) as writer:
+            writer.write_table(table)
+        os.replace(f"{path}.tmp", path)
+
+    def flush(self):
+        """Write the pending records as a new shard"""
+        pending = self.take()
+        if pending is not None:
+            self.write(*pending)
+
+
+def save_dataset(shards_dir: str, output_dir: str) -> int:
+    """
+    Save the Arrow shards of a directory as a Hugging Face dataset, loadable with `load_from_disk`.
+
+    The shards are memory-mapped, so the records aren't loaded in memory at once.
+
+    Args:
+        shards_dir: Directory of the shards
+        output_dir: Directory of the saved dataset
+
+    Returns:
+        Number of records of the dataset
+    """
+    from datasets import Dataset, concatenate_datasets
+
+    paths = sorted(glob.glob(os.path.join(shards_dir, "shard-*.arrow")))
+    if not paths:
+        return 0
+    dataset = concatenate_datasets([Dataset.from_file(path) for path in paths])
+    dataset.save_to_disk(output_dir)
+    return len(dataset)
+
+
+def call_ollama(prompt: str, model: str, base_url: str, timeout: float) -> str:
+    """
+    Generate a completion with the Ollama HTTP API.
+
+    Args:
+        prompt: The formatted prompt
+        model: Name of the Ollama model
+        base_url: URL of the Ollama server
+        timeout: Timeout of the request in seconds
+
+    Returns:
+        The generated text
+    """
+    request = urllib.request.Request(
+        f"{base_url.rstrip('/')}/api/generate",
+        data=json.dumps({"model": model, "prompt": prompt, "stream": False}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
     )
-    chain = LLMChain(llm=llm, prompt=prompt)
-
-    records = []
-    for _ in range(n_samples):
-        # sample all PII values
-        pii = sample_pii()
-        formatted_prompt = prompt.format(**pii)
-        # run LLM with placeholders
-        #print("📝 Prompt being sent to LLM:")
-        #print(formatted_prompt)
-	#print(pii)
-        raw_with_placeholders = llm(formatted_prompt)
-        # substitute placeholders → actual values
-        raw_text = raw_with_placeholders
-        print(raw_text)
-        for label, val in pii.items():
-            raw_text = raw_text.replace(f"[{label}]", val)
-        # mask & get mappings
-        masked_text, mappings = mask_entities(raw_text, pii)
-
-        records.append({
-            "id":          str(uuid.uuid4()),
-            "raw_text":    raw_text,
-            "masked_text": masked_text,
-            "entities":    json.dumps(mappings, ensure_ascii=False),
-            "locale":      "fr_FR",
-            "source":      "ollama-local",
-        })
-
-    df = pd.DataFrame(records)
-    #df.to_parquet("synthetic_pii_fr.parquet")
-    # Convert to Hugging Face Dataset
-    hf_dataset = Dataset.from_pandas(df)
-    hf_dataset.save_to_disk("PII_dataset")
-    print(f"Generated {len(df)} examples → synthetic_pii_fr")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())["response"]
+
+
+def build_record(raw_with_placeholders: str, pii: dict) -> dict:
+    """Substitute the placeholders left by the model, then mask the PII values and map their spans"""
+    raw_text = raw_with_placeholders.strip()
+    for label, val in pii.items():
+        raw_text = raw_text.replace(f"[{label}]", val)
+    masked_text, mappings = mask_entities(raw_text, pii)
+
+    return {
+        "id":          str(uuid.uuid4()),
+        "raw_text":    raw_text,
+        "masked_text": masked_text,
+        "entities":    json.dumps(mappings, ensure_ascii=False),
+        "locale":      "fr_FR",
+        "source":      "ollama-local",
+    }
+
+
+async def generate_one(model: str, base_url: str, timeout: float, max_retries: int) -> dict:
+    """
+    Generate one record, retrying failed requests with exponential backoff.
+
+    The blocking HTTP call runs in a thread, so that other requests proceed meanwhile.
+
+    Returns:
+        The record, or None when every attempt failed
+    """
+    # Sample all PII values
+    pii = sample_pii()
+    prompt = PROMPT_TEMPLATE.format(**pii)
+    for attempt in range(max_retries + 1):
+        try:
+            raw_with_placeholders = await asyncio.to_thread(call_ollama, prompt, model, base_url, timeout)
+            return build_record(raw_with_placeholders, pii)
+        except (urllib.error.URLError, http.client.HTTPException, TimeoutError, OSError, ValueError, KeyError) as e:
+            if attempt == max_retries:
+                print(f"Generation failed after {max_retries + 1} attempts: {e}")
+                return None
+            await asyncio.sleep(min(2 ** attempt, 30))
+
+
+async def generate(n_samples: int, writer: ShardWriter, model: str = "llama3.2", base_url: str = OLLAMA_URL,
+                   concurrency: int = 8, timeout: float = 120, max_retries: int = 3, report_every: float = 10) -> dict:
+    """
+    Generate records with a bounded number of requests in flight, streaming them to the shard writer.
+
+    Args:
+        n_samples: Number of records to generate
+        writer: Writer of the Arrow shards
+        model: Name of the Ollama model
+        base_url: URL of the Ollama server
+        concurrency: Maximum number of requests in flight (match OLLAMA_NUM_PARALLEL on the server)
+        timeout: Timeout of each request in seconds
+        max_retries: Retries of a failed request before its record is dropped
+        report_every: Seconds between progress reports
+
+    Returns:
+        Dictionary with the generated and failed counts, the duration and the throughput
+    """
+    start = time.perf_counter()
+    stats = {"generated": 0, "failed": 0}
+    remaining = n_samples
+    last_report = start
+
+    def report():
+        elapsed = time.perf_counter() - start
+        rate = stats["generated"] / elapsed if elapsed > 0 else 0
+        eta = (n_samples - stats["generated"] - stats["failed"]) / rate if rate > 0 else float("inf")
+        print(f"Generated {stats['generated']}/{n_samples} ({stats['failed']} failed), "
+              f"{rate:.2f} samples/s, ETA {eta / 60:.1f} min")
+
+    async def worker():
+        nonlocal remaining, last_report
+        # Each worker takes the next sample to generate, so at most `concurrency` requests are in flight
+        while remaining > 0:
+            remaining -= 1
+            record = await generate_one(model, base_url, timeout, max_retries)
+            if record is None:
+                stats["failed"] += 1
+            else:
+                stats["generated"] += 1
+                pending = writer.add(record)
+                # The shard is written in a thread, so requests keep being handled meanwhile
+                if pending is not None:
+                    await asyncio.to_thread(writer.write, *pending)
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                report()
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, n_samples))))
+    pending = writer.take()
+    if pending is not None:
+        await asyncio.to_thread(writer.write, *pending)
+    report()
+
+    duration = time.perf_counter() - start
+    return {**stats, "duration": duration, "throughput": stats["generated"] / duration if duration > 0 else 0}
+
+
+def main(n_samples: int = 10, output_dir: str = "PII_dataset", model: str = "llama3.2", base_url: str = OLLAMA_URL,
+         concurrency: int = 8, timeout: float = 120, max_retries: int = 3, shard_size: int = 1000,
+         shards_dir: str = None):
+    # Records are streamed to Arrow shards next to the dataset, then saved with `save_to_disk` as before,
+    # so `load_from_disk(output_dir)` keeps working. The dataset holds every shard of the directory,
+    # including those of interrupted runs.
+    shards_dir = shards_dir or f"{output_dir}_shards"
+    writer = ShardWriter(shards_dir, shard_size)
+    stats = asyncio.run(generate(n_samples, writer, model, base_url, concurrency, timeout, max_retries))
+    total = save_dataset(shards_dir, output_dir)
+    print(f"Generated {stats['generated']} examples → {output_dir} ({total} in total, shards in {shards_dir}) "
+          f"({stats['failed']} failed, {stats['duration']:.1f}s, {stats['throughput']:.2f} samples/s)")
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate a synthetic French PII dataset with a local Ollama model")
+    parser.add_argument("--n-samples", type=int, default=10)
+    parser.add_argument("--output-dir", default="PII_dataset", help="Directory of the saved dataset (load_from_disk)")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--base-url", default=OLLAMA_URL)
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of requests in flight")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout of each request in seconds")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--shard-size", type=int, default=1000, help="Number of records per Arrow shard")
+    parser.add_argument("--shards-dir", default=None, help="Directory of the Arrow shards (default: <output-dir>_shards)")
+    args = parser.parse_args()
+    main(args.n_samples, args.output_dir, args.model, args.base_url, args.concurrency, args.timeout,
+         args.max_retries, args.shard_size, args.shards_dir)
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pii_utils import PII_LABELS, PIIPools
+
+# ai4privacy label of each generated entity type, so the rows score like pii-masking-200k ones
+# (LOCATION has no evaluated Presidio counterpart, it stays in the masks as a street)
+AI4PRIVACY_LABELS = {
+    "PERSON":        "FIRSTNAME",
+    "EMAIL_ADDRESS": "EMAIL",
+    "PHONE_NUMBER":  "PHONEIMEI",
+    "CREDIT_CARD":   "CREDITCARDNUMBER",
+    "IBAN_CODE":     "IBAN",
+    "IP_ADDRESS":    "IPV4",
+    "LOCATION":      "STREET",
+    "DATE_TIME":     "DATE",
+}
+
+# Sentence templates by language, {LABEL} slots being filled with pool values (at most once per label)
+TEMPLATES = {
+    "fr": [
+        "Bonjour, je m'appelle {PERSON} et vous pouvez me joindre au {PHONE_NUMBER}.",
+        "Merci d'envoyer la facture à {EMAIL_ADDRESS} avant le {DATE_TIME}.",
+        "Le virement sera effectué sur l'IBAN {IBAN_CODE} au nom de {PERSON}.",
+        "Une connexion suspecte depuis l'adresse {IP_ADDRESS} a été détectée le {DATE_TIME}.",
+        "Pouvez-vous livrer le colis au {LOCATION} ? Mon numéro est le {PHONE_NUMBER}.",
+        "J'ai payé avec la carte {CREDIT_CARD}, merci de ne pas la conserver.",
+        "{PERSON} a changé son adresse mail pour {EMAIL_ADDRESS}.",
+        "Rendez-vous le {DATE_TIME} au {LOCATION} avec {PERSON}.",
+        "Ma carte {CREDIT_CARD} a été débitée deux fois, contactez-moi à {EMAIL_ADDRESS}.",
+        "Le serveur {IP_ADDRESS} n'est plus accessible depuis ce matin.",
+        "Résume ce document interne sans citer de noms ni de chiffres.",
+        "Quelle est la meilleure façon d'apprendre le français rapidement ?",
+    ],
+    "en": [
+        "Hi, my name is {PERSON} and you can reach me at {PHONE_NUMBER}.",
+        "Please send the invoice to {EMAIL_ADDRESS} before {DATE_TIME}.",
+        "Wire the refund to IBAN {IBAN_CODE}, account holder {PERSON}.",
+        "We blocked a login from {IP_ADDRESS} on {DATE_TIME}.",
+        "Ship the package to {LOCATION} and call {PHONE_NUMBER} on arrival.",
+        "My card {CREDIT_CARD} was charged twice, contact me at {EMAIL_ADDRESS}.",
+        "Summarize this internal document without quoting names or figures.",
+        "What is the fastest way to learn a new language?",
+    ],
+}
+
+SLOT_PATTERN = re.compile(r"\{([A-Z_]+)\}")
+
+SCHEMA = pa.schema([
+    ("source_text", pa.string()),
+    ("privacy_mask", pa.string()),
+    ("language", pa.string()),
+])
+
+
+def parse_template(template: str):
+    """
+    Splits a template into its literal segments and slot labels.
+
+    :return: (segments, labels), with len(segments) == len(labels) + 1
+    """
+    segments = SLOT_PATTERN.split(template)
+    return segments[::2], segments[1::2]
+
+
+def _build_template_rows(n: int, segments: list, labels: list, indices: dict, values: dict, escaped: dict,
+                         lengths: dict):
+    """
+    Builds the source texts and JSON privacy masks of the rows of one template, column-wise.
+
+    Text offsets are the cumulative lengths of the segments and values, and the JSON is
+    assembled from the pre-escaped pool values, so no row is built or serialized alone.
+    """
+    texts = np.full(n, segments[0], dtype=object)
+    masks = np.full(n, "[", dtype=object)
+    offsets = np.full(n, len(segments[0]), dtype=np.int64)
+    for slot, label in enumerate(labels):
+        idx = indices[label]
+        starts = offsets
+        ends = starts + lengths[label][idx]
+        texts = texts + values[label][idx] + segments[slot + 1]
+        masks = (masks + (", " if slot else "") + f'{{"label": "{AI4PRIVACY_LABELS[label]}", "start": '
+                 + starts.astype(str).astype(object) + ', "end": ' + ends.astype(str).astype(object)
+                 + ', "value": ' + escaped[label][idx] + "}")
+        offsets = ends + len(segments[slot + 1])
+    return texts, masks + "]"
+
+
+def pool_columns(pools: PIIPools):
+    """
+    Computes the JSON-escaped form and the length of every pool value, once for all the shards.
+
+    :return: (escaped, lengths) dicts of arrays by label, aligned with pools.values
+    """
+    escaped = {label: np.array([json.dumps(val, ensure_ascii=False) for val in pools.values[label]], dtype=object)
+               for label in PII_LABELS}
+    lengths = {label: np.fromiter(map(len, pools.values[label]), dtype=np.int64, count=len(pools.values[label]))
+               for label in PII_LABELS}
+    return escaped, lengths
+
+
+def generate_shard(pools: PIIPools, n: int, rng: np.random.Generator, escaped: dict, lengths: dict,
+                   templates: dict = TEMPLATES) -> pa.Table:
+    """
+    Generates n ai4privacy-compatible rows (source_text, privacy_mask, language).
+
+    Each row draws a locale from the pools, a template of its language and pool values
+    for the template slots, rows being grouped by template to be built column-wise.
+
+    Args:
+        pools: The PII value pools
+        n: Number of rows
+        rng: Random generator of the shard
+        escaped, lengths: Columns of the pools, from pool_columns
+        templates: Sentence templates by language
+
+    Returns:
+        The rows as an Arrow table
+    """
+    languages = [locale.split("_")[0] for locale in pools.locales]
+    missing = sorted(set(languages) - set(templates))
+    if missing:
+        raise ValueError(f"No templates for language(s) {', '.join(missing)}")
+
+    locale_idx, indices = pools.sample_indices(n, rng)
+    texts = np.empty(n, dtype=object)
+    masks = np.empty(n, dtype=object)
+    for idx, language in enumerate(languages):
+        rows = np.flatnonzero(locale_idx == idx)
+        template_idx = rng.integers(0, len(templates[language]), len(rows))
+        for template_id, template in enumerate(templates[language]):
+            template_rows = rows[template_idx == template_id]
+            if len(template_rows) == 0:
+                continue
+            segments, labels = parse_template(template)
+            texts[template_rows], masks[template_rows] = _build_template_rows(
+                len(template_rows), segments, labels, {label: indices[label][template_rows] for label in labels},
+                pools.values, escaped, lengths
+            )
+
+    return pa.table({
+        "source_text": pa.array(texts, type=pa.string()),
+        "privacy_mask": pa.array(masks, type=pa.string()),
+        "language": pa.array(np.array(languages, dtype=object)[locale_idx], type=pa.string()),
+    }, schema=SCHEMA)
+
+
+def main(n_rows: int = 1_000_000, output_dir: str = "synthetic_pii", locales: list = ["fr_FR"], seed: int = 0,
+         pool_size: int = 10000, shard_size: int = 250_000, num_proc: int = None):
+    start = time.perf_counter()
+    pools = PIIPools(pool_size, locales, seed, num_proc)
+    escaped, lengths = pool_columns(pools)
+    print(f"Generated pools of {pool_size} values per locale in {time.perf_counter() - start:.2f}s")
+
+    os.makedirs(output_dir, exist_ok=True)
+    num_shards = (n_rows + shard_size - 1) // shard_size
+    for shard in range(num_shards):
+        # One generator per shard, so a shard only depends on the seed and its index
+        rng = np.random.default_rng([seed, shard])
+        table = generate_shard(pools, min(shard_size, n_rows - shard * shard_size), rng, escaped, lengths)
+        pq.write_table(table, os.path.join(output_dir, f"train-{shard:05d}-of-{num_shards:05d}.parquet"))
+        print(f"Shard {shard + 1}/{num_shards}: {table.num_rows} rows")
+
+    duration = time.perf_counter() - start
+    print(f"Generated {n_rows} rows → {output_dir} in {duration:.2f}s ({n_rows / duration:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate an ai4privacy-compatible synthetic PII dataset from templates")
+    parser.add_argument("--n-rows", type=int, default=1_000_000)
+    parser.add_argument("--output-dir", default="synthetic_pii")
+    parser.add_argument("--locales", nargs="+", default=["fr_FR"], help="Faker locales, with templates of their language")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pool-size", type=int, default=10000, help="Values per locale and entity type")
+    parser.add_argument("--shard-size", type=int, default=250_000, help="Rows per Parquet shard")
+    parser.add_argument("--num-proc", type=int, default=None, help="Worker processes generating the pools")
+    args = parser.parse_args()
+    main(args.n_rows, args.output_dir, args.locales, args.seed, args.pool_size, args.shard_size, args.num_proc)
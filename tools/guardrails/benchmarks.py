@@ -1,30 +1,207 @@
+from typing import TYPE_CHECKING
+
+from datasets import Dataset
+
+from common.cache import PredictionCache
+from common.checkpoint import DEFAULT_CHECKPOINT_EVERY, Checkpoint
+from common.comparison import MetricsComparison
+from common.loadtest import LoadTestResult, run_load_tests
 from common.metrics import EvaluationMetrics
-from utils.datasets import load_dataset, get_ai4privacy_to_presidio_mapping
+from common.parallel import run_isolated, run_sharded
+from common.scaling import DEFAULT_SIZES, ScalingResult, build_length_inputs, run_scaling
+from common.scanners import WARMUP_TEXT, get_scanner
+from utils.datasets import load_dataset, select_samples, prepare_ai4privacy, get_ai4privacy_to_presidio_mapping
 
-from .validators.pii import evaluate_pii_detection
-from .validators.jailbreak import evaluate_jailbreak
+if TYPE_CHECKING:
+    from .profiling import GuardProfile
 
-def bench_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str]) -> EvaluationMetrics:
-    print(f"Preparing dataset for PII Evaluation...")
-    dataset = load_dataset(dataset, split)
-    if preferred_language != "":
-        dataset = dataset.filter(lambda example: example["language"] == preferred_language)
+# Validator modules are imported by their benchmark only, so running one benchmark
+# doesn't load the dependencies of the others
+
+def bench_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+              num_workers: int = 1, streaming: bool = False, cache_path: str = None,
+              max_details: int = None, spill_dir: str = None,
+              resume: bool = False, checkpoint_path: str = None, checkpoint_every: int = None,
+              reuse_scanner: bool = False, span_criterion: str = None, iou_threshold: float = 0.5,
+              num_proc: int = None) -> EvaluationMetrics:
+    from .validators.pii import evaluate_pii_detection
     
-    dataset = dataset.select(range(min(len(dataset), max_split_size)))
+    cache = PredictionCache(cache_path) if cache_path else None
+    checkpoint = Checkpoint(
+        checkpoint_path or ".checkpoints/guardrails_pii.pkl", every=checkpoint_every or DEFAULT_CHECKPOINT_EVERY, resume=resume,
+        fingerprint=(dataset, split, max_split_size, preferred_language, sorted(entities), num_workers,
+                     span_criterion, iou_threshold)
+    ) if checkpoint_every or resume else None
+    print(f"Preparing dataset for PII Evaluation...")
+    dataset = load_dataset(dataset, split, streaming=streaming)
+    dataset = select_samples(dataset, max_split_size, preferred_language, num_proc=num_proc)
+    dataset = prepare_ai4privacy(dataset, entities, num_proc=num_proc)
     print(f"Running GuardRails PII Evaluation...")
     
-    metrics: EvaluationMetrics = evaluate_pii_detection(dataset, entities)
+    metrics: EvaluationMetrics = run_sharded(
+        evaluate_pii_detection, dataset, num_workers, entities,
+        cache=cache, max_details=max_details, spill_dir=spill_dir, checkpoint=checkpoint,
+        reuse_scanner=reuse_scanner, span_criterion=span_criterion, iou_threshold=iou_threshold
+    )
     print(f"Finished GuardRails PII Evaluation!")
     return metrics
 
 
-def bench_jailbreak(dataset: str, split: str, max_split_size: int) -> EvaluationMetrics:
-    print(f"Preparing dataset for PII Evaluation...")
-    dataset = load_dataset(dataset, split)
+def bench_jailbreak(dataset: str, split: str, max_split_size: int,
+                    num_workers: int = 1, streaming: bool = False, cache_path: str = None,
+                    sweep_thresholds: list[float] = None, max_details: int = None, spill_dir: str = None,
+                    resume: bool = False, checkpoint_path: str = None, checkpoint_every: int = None,
+                    reuse_scanner: bool = False, quantize: bool = False, rows: Dataset = None) -> EvaluationMetrics:
+    # rows: already selected rows of the dataset, to run several variants on a single load
+    from .validators.jailbreak import evaluate_jailbreak
     
-    dataset = dataset.select(range(min(len(dataset), max_split_size)))
+    cache = PredictionCache(cache_path) if cache_path else None
+    checkpoint = Checkpoint(
+        checkpoint_path or f".checkpoints/guardrails_jailbreak{'_int8' if quantize else ''}.pkl", every=checkpoint_every or DEFAULT_CHECKPOINT_EVERY,
+        resume=resume, fingerprint=(dataset, split, max_split_size, sweep_thresholds, num_workers, quantize)
+    ) if checkpoint_every or resume else None
+    if rows is None:
+        print(f"Preparing dataset for Jailbreak Evaluation...")
+        rows = select_samples(load_dataset(dataset, split, streaming=streaming), max_split_size)
     print(f"Running GuardRails Jailbreak Evaluation...")
     
-    metrics: EvaluationMetrics = evaluate_jailbreak(dataset)
+    metrics: EvaluationMetrics = run_sharded(
+        evaluate_jailbreak, rows, num_workers,
+        cache=cache, sweep_thresholds=sweep_thresholds, max_details=max_details, spill_dir=spill_dir, checkpoint=checkpoint,
+        reuse_scanner=reuse_scanner, quantize=quantize
+    )
     print(f"Finished GuardRails Jailbreak Evaluation!")
-    return metrics
\ No newline at end of file
+    return metrics
+
+
+def bench_jailbreak_quantization(dataset: str, split: str, max_split_size: int, **kwargs) -> MetricsComparison:
+    """Run the Jailbreak benchmark with the full precision and int8 quantized validator models and compare them"""
+    # A checkpoint path would be shared by both variants, each one keeps its default path
+    kwargs.pop("checkpoint_path", None)
+    # Rows selected once (a stream is read once), for both variants and to review the flipped predictions
+    rows = select_samples(load_dataset(dataset, split, streaming=kwargs.get("streaming", False)), max_split_size)
+    if not isinstance(rows, Dataset):
+        rows = Dataset.from_list(list(rows))
+    # Each variant runs in a fresh process, so the int8 memory doesn't include what the fp32 run left allocated
+    variants = {
+        variant: run_isolated(bench_jailbreak, dataset, split, max_split_size, quantize=variant == "int8",
+                              rows=rows, **kwargs)
+        for variant in ["fp32", "int8"]
+    }
+    return MetricsComparison("guardrails_jailbreak_quantization", variants, texts=rows["prompt"])
+
+
+def load_test_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+                  concurrency_levels: list[int], target_qps: float = None, num_requests: int = None,
+                  reuse_scanner: bool = False) -> list[LoadTestResult]:
+    from .validators.pii import anonymize, build_guard
+    
+    print(f"Preparing dataset for PII Load Test...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size, preferred_language)
+    prompts = [example["source_text"] for example in dataset]
+    
+    guard, _ = get_scanner(("guardrails_pii", tuple(sorted(entities))), lambda: build_guard(entities), reuse_scanner)
+    anonymize(guard, WARMUP_TEXT)
+    print(f"Running GuardRails PII Load Test...")
+    
+    results = run_load_tests(
+        "guardrails_pii", lambda text: anonymize(guard, text), prompts, concurrency_levels, target_qps, num_requests
+    )
+    print(f"Finished GuardRails PII Load Test!")
+    return results
+
+
+def load_test_jailbreak(dataset: str, split: str, max_split_size: int,
+                        concurrency_levels: list[int], target_qps: float = None, num_requests: int = None,
+                        reuse_scanner: bool = False) -> list[LoadTestResult]:
+    from .validators.jailbreak import build_detector, detect_jailbreak
+    
+    print(f"Preparing dataset for Jailbreak Load Test...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size)
+    prompts = [example["prompt"] for example in dataset]
+    
+    # Same scanner key and object as evaluate_jailbreak, so a reused detector fits both
+    (guard, _), _ = get_scanner("guardrails_jailbreak", build_detector, reuse_scanner)
+    detect_jailbreak(guard, WARMUP_TEXT)
+    print(f"Running GuardRails Jailbreak Load Test...")
+    
+    results = run_load_tests(
+        "guardrails_jailbreak", lambda text: detect_jailbreak(guard, text), prompts, concurrency_levels, target_qps, num_requests
+    )
+    print(f"Finished GuardRails Jailbreak Load Test!")
+    return results
+
+
+def profile_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+                modes: tuple[str, ...] = ("guard", "direct")) -> list["GuardProfile"]:
+    from .profiling import profile_validator
+    from .validators.pii import build_validator
+    
+    print(f"Preparing dataset for PII Profiling...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size, preferred_language)
+    prompts = [example["source_text"] for example in dataset]
+    
+    validator = build_validator(entities)
+    print(f"Running GuardRails PII Profiling...")
+    
+    profiles = [profile_validator("guardrails_pii", validator, prompts, mode) for mode in modes]
+    print(f"Finished GuardRails PII Profiling!")
+    return profiles
+
+
+def profile_jailbreak(dataset: str, split: str, max_split_size: int,
+                      modes: tuple[str, ...] = ("guard", "direct")) -> list["GuardProfile"]:
+    from .profiling import profile_validator
+    from .validators.jailbreak import build_validator
+    
+    print(f"Preparing dataset for Jailbreak Profiling...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size)
+    prompts = [example["prompt"] for example in dataset]
+    
+    validator = build_validator()
+    print(f"Running GuardRails Jailbreak Profiling...")
+    
+    profiles = [profile_validator("guardrails_jailbreak", validator, prompts, mode) for mode in modes]
+    print(f"Finished GuardRails Jailbreak Profiling!")
+    return profiles
+
+
+def scale_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+              sizes: list[int] = DEFAULT_SIZES, variants: int = 3, repeats: int = 3,
+              reuse_scanner: bool = False) -> ScalingResult:
+    from .validators.pii import anonymize, build_guard
+    
+    print(f"Preparing inputs for PII Scaling...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size, preferred_language)
+    inputs = build_length_inputs([example["source_text"] for example in dataset], sizes, variants)
+    
+    guard, _ = get_scanner(("guardrails_pii", tuple(sorted(entities))), lambda: build_guard(entities), reuse_scanner)
+    print(f"Running GuardRails PII Scaling...")
+    
+    result = run_scaling("guardrails_pii", lambda text: anonymize(guard, text), inputs, repeats)
+    print(f"Finished GuardRails PII Scaling!")
+    return result
+
+
+def scale_jailbreak(dataset: str, split: str, max_split_size: int,
+                    sizes: list[int] = DEFAULT_SIZES, variants: int = 3, repeats: int = 3,
+                    reuse_scanner: bool = False) -> ScalingResult:
+    from .validators.jailbreak import build_detector, detect_jailbreak
+    
+    print(f"Preparing inputs for Jailbreak Scaling...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size)
+    inputs = build_length_inputs([example["prompt"] for example in dataset], sizes, variants)
+    
+    # Same scanner key and object as evaluate_jailbreak, so a reused detector fits both
+    (guard, _), _ = get_scanner("guardrails_jailbreak", build_detector, reuse_scanner)
+    print(f"Running GuardRails Jailbreak Scaling...")
+    
+    result = run_scaling("guardrails_jailbreak", lambda text: detect_jailbreak(guard, text), inputs, repeats)
+    print(f"Finished GuardRails Jailbreak Scaling!")
+    return result
@@ -0,0 +1,194 @@
+from guardrails import Guard
+
+from array import array
+import time
+from typing import Any, Callable, List
+
+import numpy as np
+
+from common.quantization import find_models
+from common.scanners import WARMUP_TEXT
+
+# Layers of a validation, from the outside in
+LAYERS = ["guard_overhead", "validator_processing", "inference"]
+
+
+class GuardProfile:
+    def __init__(self, label: str, mode: str):
+        """
+        Initialize the GuardProfile class.
+
+        :param label: Label of the profiled validator
+        :param mode: "guard" (through Guard.validate) or "direct" (calling the validator itself)
+        """
+        self.label = label
+        self.mode = mode
+
+        # Per-validation durations in seconds: whole call, validator call, model forward passes
+        self.totals = array("d")
+        self.validator_times = array("d")
+        self.inference_times = array("d")
+
+    def calculate_metrics(self):
+        """
+        Split the validation time into Guard overhead, validator processing and model inference.
+
+        Guard overhead is the time outside the validator (orchestration, logging, history, exceptions),
+        validator processing the time in the validator outside the model forward passes (tokenization,
+        pre and post processing). Without a PyTorch model to instrument, inference is counted as
+        validator processing.
+
+        :return: Dictionary of mean, p50 and p99 (in seconds) and share of the total time per layer
+        """
+        if len(self.totals) == 0:
+            return {}
+
+        totals = np.array(self.totals, dtype=np.float64)
+        validator_times = np.array(self.validator_times, dtype=np.float64)
+        inference_times = np.array(self.inference_times, dtype=np.float64)
+        layers = {
+            "guard_overhead": totals - validator_times,
+            "validator_processing": validator_times - inference_times,
+            "inference": inference_times
+        }
+
+        total_time = float(totals.sum())
+        metrics = {"validations": len(totals), "total_mean": float(totals.mean())}
+        for layer, durations in layers.items():
+            metrics[layer] = {
+                "mean": float(durations.mean()),
+                "p50": float(np.percentile(durations, 50)),
+                "p99": float(np.percentile(durations, 99)),
+                "share": float(durations.sum()) / total_time if total_time > 0 else 0
+            }
+        return metrics
+
+
+class _Timer:
+    """Accumulates the time spent in the functions it wraps"""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def wrap(self, function: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - start
+        return timed
+
+
+def _model_forwards(validator: Any) -> List[Any]:
+    """Return the PyTorch models of a validator, or none when PyTorch isn't installed"""
+    try:
+        return [getattr(owner, name) for owner, name in find_models(validator)]
+    except ImportError:
+        return []
+
+
+def profile_validator(label: str, validator: Any, texts: List[str], mode: str = "guard") -> GuardProfile:
+    """
+    Profile the validations of texts, layer by layer.
+
+    The validator `validate` method and the `forward` of its PyTorch models are wrapped with timers
+    (on the instances, and restored afterwards), and each validation is timed as a whole. In "guard"
+    mode texts go through `Guard().use(validator).validate`, as in the evaluations. In "direct" mode
+    the validator is called without the Guard, which gives the raw cost of the validator.
+
+    Args:
+        label: Label of the profiled validator
+        validator: The Guardrails validator instance
+        texts: Texts to validate
+        mode: "guard" or "direct"
+
+    Returns:
+        A GuardProfile with the per-validation durations of each layer
+    """
+    if mode not in ("guard", "direct"):
+        raise ValueError(f"Invalid profiling mode: {mode}")
+
+    profile = GuardProfile(label, mode)
+    guard = Guard().use(validator) if mode == "guard" else None
+
+    def validate(text: str):
+        if guard is None:
+            return validator.validate(text, {})
+        try:
+            return guard.validate(text)
+        except Exception:
+            # Failing validations may raise (e.g. a detected jailbreak), it's part of the Guard cost
+            return None
+
+    validator_timer = _Timer()
+    inference_timer = _Timer()
+    models = _model_forwards(validator)
+    validator.validate = validator_timer.wrap(validator.validate)
+    for model in models:
+        model.forward = inference_timer.wrap(model.forward)
+
+    try:
+        # First call out of the profile, it pays for lazy initializations
+        validate(WARMUP_TEXT)
+        for text in texts:
+            validator_timer.elapsed = 0.0
+            inference_timer.elapsed = 0.0
+            start = time.perf_counter()
+            validate(text)
+            profile.totals.append(time.perf_counter() - start)
+            profile.validator_times.append(validator_timer.elapsed)
+            profile.inference_times.append(inference_timer.elapsed)
+    finally:
+        # Back to the class methods
+        del validator.validate
+        for model in models:
+            del model.forward
+
+    return profile
+
+
+def display_profiles(profiles: List[GuardProfile], save_path: str = None):
+    """
+    Display the layer breakdown of each profile as a table and a stacked bar chart.
+
+    :param profiles: Profiles to display (e.g. the guard and direct modes of one validator)
+    :param save_path: Optional path to save the plot
+    """
+    import matplotlib.pyplot as plt
+
+    print("Guard Overhead Profile")
+    print("=" * 40)
+    print("Validator                  Mode    Total (ms)  Guard (ms)  Validator (ms)  Inference (ms)  Guard share")
+
+    rows = []
+    for profile in profiles:
+        metrics = profile.calculate_metrics()
+        if not metrics:
+            continue
+        rows.append((f"{profile.label} ({profile.mode})", metrics))
+        print(f"{profile.label:<25}  {profile.mode:<6}  {metrics['total_mean'] * 1000:<10.2f}  "
+              f"{metrics['guard_overhead']['mean'] * 1000:<10.2f}  "
+              f"{metrics['validator_processing']['mean'] * 1000:<14.2f}  "
+              f"{metrics['inference']['mean'] * 1000:<14.2f}  {metrics['guard_overhead']['share']:.2%}")
+
+    if not rows:
+        return
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    names = [name for name, _ in rows]
+    bottom = np.zeros(len(rows))
+    for layer, color in zip(LAYERS, ['#F44336', '#FF9800', '#4CAF50']):
+        means = np.array([metrics[layer]['mean'] * 1000 for _, metrics in rows])
+        ax.bar(names, means, bottom=bottom, color=color, label=layer)
+        bottom += means
+    ax.set_ylabel('Mean milliseconds per validation')
+    ax.set_title('Guardrails Validation Time by Layer')
+    ax.legend()
+
+    plt.tight_layout()
+    plt.show()
+
+    if save_path:
+        fig.savefig(save_path, dpi=300, bbox_inches='tight')
+        print(f"\nProfile plot saved to {save_path}")
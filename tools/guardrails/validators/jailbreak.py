@@ -2,47 +2,153 @@ from guardrails.hub import DetectJailbreak
 from guardrails import Guard, ValidationOutcome
 
 from datetime import datetime
+import time
+from typing import List, Optional, Tuple
 
 from datasets import Dataset
 
+from common.cache import PredictionCache, cached_scan
+from common.checkpoint import Checkpoint, restore_checkpoint
 from common.metrics import EvaluationMetrics
+from common.quantization import model_weight_bytes, quantize_models
+from common.scanners import prepare_scanner, resident_memory
+from utils.datasets import dataset_length, report_progress, skip_samples
 
 
-def evaluate_jailbreak(dataset: Dataset) -> EvaluationMetrics:
+def _keep_scores(validator: DetectJailbreak):
+    """Keep the highest jailbreak score computed by the last validation on the validator, as `last_score`"""
+    validator.last_score = None
+    predict_jailbreak = getattr(validator, "predict_jailbreak", None)
+    if predict_jailbreak is None:
+        return
+
+    def predict_and_keep(*args, **kwargs):
+        scores = predict_jailbreak(*args, **kwargs)
+        validator.last_score = float(max(scores)) if len(scores) > 0 else None
+        return scores
+    validator.predict_jailbreak = predict_and_keep
+
+
+def build_validator(quantize: bool = False) -> DetectJailbreak:
+    """
+    Build the DetectJailbreak validator (int8 dynamically quantized with quantize).
+    
+    Failing validations don't raise (on_fail="noop"), the outcome says whether a jailbreak was
+    detected, and the raw score of the last validation is kept on `last_score`.
+    """
+    validator = DetectJailbreak(on_fail="noop")
+    if quantize:
+        quantize_models(validator)
+    _keep_scores(validator)
+    return validator
+
+
+def build_detector(quantize: bool = False) -> Tuple[Guard, DetectJailbreak]:
+    """Build the Guardrails guard running the DetectJailbreak validator, returned with the validator"""
+    validator = build_validator(quantize)
+    return Guard().use(
+        validator
+    ), validator
+
+
+def build_guard(quantize: bool = False) -> Guard:
+    """Build the Guardrails guard running the DetectJailbreak validator (int8 dynamically quantized with quantize)"""
+    return build_detector(quantize)[0]
+
+
+def detect_jailbreak(guard: Guard, text: str) -> bool:
+    """
+    Validate a text with the guard, returning whether it was detected as a jailbreak.
+    
+    Raises:
+        RuntimeError: When the validation itself failed (model or runtime error)
+    """
+    outcome: ValidationOutcome = guard.validate(text)
+    if outcome.error:
+        raise RuntimeError(outcome.error)
+    return not outcome.validation_passed
+
+
+def score_jailbreak(detector: Tuple[Guard, DetectJailbreak], text: str) -> Tuple[bool, Optional[float]]:
+    """Validate a text, returning whether it was detected as a jailbreak and its raw score (None if unavailable)"""
+    guard, validator = detector
+    validator.last_score = None
+    detected = detect_jailbreak(guard, text)
+    return detected, validator.last_score
+
+
+def evaluate_jailbreak(dataset: Dataset, cache: PredictionCache = None, sweep_thresholds: List[float] = None,
+                       max_details: int = None, spill_dir: str = None,
+                       checkpoint: Checkpoint = None, reuse_scanner: bool = False,
+                       quantize: bool = False) -> EvaluationMetrics:
     """
     Evaluate Guardrails's Jailbreak detection capabilities against a ground truth dataset.
     
     Args:
         dataset: The dataset
+        cache: Optional prediction cache, to reuse the predictions of previous runs
+        sweep_thresholds: Optional thresholds of the sweep of the recorded raw scores
+        max_details: Optional maximum number of details kept in memory per category
+        spill_dir: Optional directory where the details beyond max_details are written as JSONL
+        checkpoint: Optional checkpoint, to save the progress periodically and resume an interrupted run
+        reuse_scanner: Reuse the guard built by a previous evaluation in this process
+        quantize: Run int8 dynamically quantized copies of the validator models
         
     Returns:
         An EvaluationMetrics object with the evaluation results
     """
-    # Initialize components
-    metrics = EvaluationMetrics("guardrails_jailbreak")
-    guard = Guard().use(
-        DetectJailbreak
-    )
+    # Initialize components, the quantized variant having its own label (and so scanner and cache keys)
+    label = "guardrails_jailbreak_int8" if quantize else "guardrails_jailbreak"
+    metrics = EvaluationMetrics(label, max_details=max_details, spill_dir=spill_dir)
+    
+    # Restore the partial metrics of an interrupted run
+    start_position, metrics, finished = restore_checkpoint(checkpoint, metrics)
+    if finished:
+        return metrics
+    
+    if sweep_thresholds is not None:
+        metrics.sweep_thresholds = sorted(sweep_thresholds)
+    detector = prepare_scanner(metrics, label, lambda: build_detector(quantize), score_jailbreak, reuse_scanner)
+    metrics.model_weights = model_weight_bytes(detector[1])
+    cache_namespace = PredictionCache.namespace(label, {
+        "validator": "DetectJailbreak",
+        "on_fail": "noop",
+        "raw_score": True
+    })
 
-    total_samples = len(dataset)
+    total_samples = dataset_length(dataset)
+    position = start_position
     # Process each example in the dataset
-    for idx, example in enumerate(dataset):
+    for idx, example in enumerate(skip_samples(dataset, start_position), start=start_position):
+        if checkpoint is not None:
+            checkpoint.update(idx, metrics)
+        position = idx + 1
 
         if idx % 100 == 0:
-            print(f"Processing {idx}/{total_samples} samples ({int(idx/total_samples*100)}%)")
+            report_progress(idx, total_samples)
         
         source_text = example["prompt"]
         ground_truth_jailbreak = example["type"] == "jailbreak"
 
-        guardrails_detected_jailbreak = False
+        scan_start = time.perf_counter()
         try:
-            guard.validate(source_text)
+            (guardrails_detected_jailbreak, score), from_cache = cached_scan(
+                cache, cache_namespace, source_text, lambda: score_jailbreak(detector, source_text)
+            )
         except Exception as e:
-            # An exception indicates a potential jailbreak attempt
-            guardrails_detected_jailbreak = True
+            # A failed validation is an error, not a detection
+            metrics.record_scan_error({
+                "text": source_text,
+                "error": repr(e)
+            })
+            continue
+        if not from_cache:
+            metrics.record_latency(time.perf_counter() - scan_start)
         
         metrics.increment_evaluated_prompts()
-        
+        metrics.record_prediction(guardrails_detected_jailbreak, ground_truth_jailbreak)
+        if score is not None:
+            metrics.record_score(score, ground_truth_jailbreak)
         
         # Compare GuardrailsAI detection with ground truth
         if ground_truth_jailbreak and guardrails_detected_jailbreak:
@@ -68,5 +174,10 @@ def evaluate_jailbreak(dataset: Dataset) -> EvaluationMetrics:
     
     # Set end time for evaluation duration calculation
     metrics.end_date = datetime.now()
+    metrics.resident_memory = resident_memory()
+    if checkpoint is not None:
+        checkpoint.save(position, metrics, finished=True)
+    if cache is not None:
+        print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
     
     return metrics
\ No newline at end of file
@@ -1,29 +1,191 @@
+from datasets import Dataset
+
+from common.cache import PredictionCache
+from common.checkpoint import DEFAULT_CHECKPOINT_EVERY, Checkpoint
+from common.comparison import MetricsComparison
+from common.loadtest import LoadTestResult, run_load_tests
 from common.metrics import EvaluationMetrics
-from utils.datasets import load_dataset, get_ai4privacy_to_presidio_mapping
+from common.parallel import run_isolated, run_sharded
+from common.scaling import DEFAULT_SIZES, ScalingResult, build_length_inputs, run_scaling
+from common.scanners import WARMUP_TEXT, get_scanner
+from utils.datasets import load_dataset, select_samples, prepare_ai4privacy, get_ai4privacy_to_presidio_mapping
 
-from .input_scanners.pii import evaluate_pii_detection
-from .input_scanners.toxicity import evaluate_toxicity
+# Scanner modules are imported by their benchmark only, so running one benchmark
+# doesn't load the dependencies of the others
 
-def bench_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str]) -> EvaluationMetrics:
-    print(f"Preparing dataset for PII Evaluation...")
-    dataset = load_dataset(dataset, split)
-    if preferred_language != "":
-        dataset = dataset.filter(lambda example: example["language"] == preferred_language)
+def bench_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+              num_workers: int = 1, streaming: bool = False, cache_path: str = None,
+              max_details: int = None, spill_dir: str = None,
+              resume: bool = False, checkpoint_path: str = None, checkpoint_every: int = None,
+              reuse_scanner: bool = False, span_criterion: str = None, iou_threshold: float = 0.5,
+              num_proc: int = None, use_onnx: bool = False) -> EvaluationMetrics:
+    from .input_scanners.pii import evaluate_pii_detection
     
-    dataset = dataset.select(range(min(len(dataset), max_split_size)))
+    cache = PredictionCache(cache_path) if cache_path else None
+    checkpoint = Checkpoint(
+        checkpoint_path or f".checkpoints/llmguard_pii{'_onnx' if use_onnx else ''}.pkl", every=checkpoint_every or DEFAULT_CHECKPOINT_EVERY,
+        resume=resume, fingerprint=(dataset, split, max_split_size, preferred_language, sorted(entities), num_workers,
+                                    span_criterion, iou_threshold, use_onnx)
+    ) if checkpoint_every or resume else None
+    print(f"Preparing dataset for PII Evaluation...")
+    dataset = load_dataset(dataset, split, streaming=streaming)
+    dataset = select_samples(dataset, max_split_size, preferred_language, num_proc=num_proc)
+    dataset = prepare_ai4privacy(dataset, entities, num_proc=num_proc)
     print(f"Running LLMGuard PII Evaluation...")
     
-    metrics: EvaluationMetrics = evaluate_pii_detection(dataset, entities)
+    metrics: EvaluationMetrics = run_sharded(
+        evaluate_pii_detection, dataset, num_workers, entities,
+        cache=cache, max_details=max_details, spill_dir=spill_dir, checkpoint=checkpoint,
+        reuse_scanner=reuse_scanner, span_criterion=span_criterion, iou_threshold=iou_threshold,
+        use_onnx=use_onnx
+    )
     print(f"Finished LLMGuard PII Evaluation!")
     return metrics
 
 
-def bench_toxicity(dataset: str, split: str, max_split_size: int, subset: str, threshold: float) -> EvaluationMetrics:
-    print(f"Preparing dataset for PII Evaluation...")
+def bench_toxicity(dataset: str, split: str, max_split_size: int, subset: str, threshold: float, batch_size: int = 1,
+                   num_workers: int = 1, streaming: bool = False, cache_path: str = None,
+                   sweep_thresholds: list[float] = None, max_details: int = None, spill_dir: str = None,
+                   resume: bool = False, checkpoint_path: str = None, checkpoint_every: int = None,
+                   reuse_scanner: bool = False, use_onnx: bool = False, quantize: bool = False,
+                   max_batch_tokens: int = None, max_batch_size: int = None, rows: Dataset = None) -> EvaluationMetrics:
+    # rows: already selected rows of the dataset, to run several variants on a single load
+    from .input_scanners.toxicity import evaluate_toxicity
+    
+    cache = PredictionCache(cache_path) if cache_path else None
+    checkpoint = Checkpoint(
+        checkpoint_path or f".checkpoints/llmguard_toxicity{'_onnx' if use_onnx else ''}{'_int8' if quantize else ''}.pkl",
+        every=checkpoint_every or DEFAULT_CHECKPOINT_EVERY, resume=resume,
+        fingerprint=(dataset, split, max_split_size, subset, threshold, sweep_thresholds, num_workers, use_onnx, quantize,
+                     max_batch_tokens, max_batch_size)
+    ) if checkpoint_every or resume else None
+    if rows is None:
+        print(f"Preparing dataset for Toxicity Evaluation...")
+        rows = select_samples(load_dataset(dataset, split, subset, streaming=streaming), max_split_size)
+    print(f"Running LLMGuard Toxicity Evaluation...")
+    
+    metrics: EvaluationMetrics = run_sharded(
+        evaluate_toxicity, rows, num_workers, threshold, batch_size,
+        cache=cache, sweep_thresholds=sweep_thresholds, max_details=max_details, spill_dir=spill_dir,
+        checkpoint=checkpoint,
+        reuse_scanner=reuse_scanner, use_onnx=use_onnx, quantize=quantize,
+        max_batch_tokens=max_batch_tokens, max_batch_size=max_batch_size
+    )
+    print(f"Finished LLMGuard Toxicity Evaluation!")
+    return metrics
+
+
+def bench_pii_backends(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+                       **kwargs) -> MetricsComparison:
+    """Run the PII benchmark with the PyTorch and ONNX Runtime backends and compare them side by side"""
+    # A checkpoint path would be shared by both backends, each one keeps its default path
+    kwargs.pop("checkpoint_path", None)
+    return MetricsComparison("llmguard_pii_backends", {
+        backend: bench_pii(dataset, split, max_split_size, preferred_language, entities,
+                           use_onnx=backend == "onnx", **kwargs)
+        for backend in ["pytorch", "onnx"]
+    })
+
+
+def bench_toxicity_backends(dataset: str, split: str, max_split_size: int, subset: str, threshold: float,
+                            **kwargs) -> MetricsComparison:
+    """Run the Toxicity benchmark with the PyTorch and ONNX Runtime backends and compare them side by side"""
+    # A checkpoint path would be shared by both backends, each one keeps its default path
+    kwargs.pop("checkpoint_path", None)
+    return MetricsComparison("llmguard_toxicity_backends", {
+        backend: bench_toxicity(dataset, split, max_split_size, subset, threshold,
+                                use_onnx=backend == "onnx", **kwargs)
+        for backend in ["pytorch", "onnx"]
+    })
+
+
+def bench_toxicity_quantization(dataset: str, split: str, max_split_size: int, subset: str, threshold: float,
+                                **kwargs) -> MetricsComparison:
+    """Run the Toxicity benchmark with the full precision and int8 quantized classifier and compare them"""
+    # A checkpoint path would be shared by both variants, each one keeps its default path
+    kwargs.pop("checkpoint_path", None)
+    # Rows selected once (a stream is read once), for both variants and to review the flipped predictions
+    rows = select_samples(load_dataset(dataset, split, subset, streaming=kwargs.get("streaming", False)), max_split_size)
+    if not isinstance(rows, Dataset):
+        rows = Dataset.from_list(list(rows))
+    # Each variant runs in a fresh process, so the int8 memory doesn't include what the fp32 run left allocated
+    variants = {
+        variant: run_isolated(bench_toxicity, dataset, split, max_split_size, subset, threshold,
+                              quantize=variant == "int8", rows=rows, **kwargs)
+        for variant in ["fp32", "int8"]
+    }
+    return MetricsComparison("llmguard_toxicity_quantization", variants, texts=rows["text"])
+
+
+def load_test_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+                  concurrency_levels: list[int], target_qps: float = None, num_requests: int = None,
+                  reuse_scanner: bool = False) -> list[LoadTestResult]:
+    from .input_scanners.pii import build_scanner
+    
+    print(f"Preparing dataset for PII Load Test...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size, preferred_language)
+    prompts = [example["source_text"] for example in dataset]
+    
+    scanner, _ = get_scanner(("llmguard_pii", tuple(sorted(entities))), lambda: build_scanner(entities), reuse_scanner)
+    scanner.scan(WARMUP_TEXT)
+    print(f"Running LLMGuard PII Load Test...")
+    
+    results = run_load_tests("llmguard_pii", scanner.scan, prompts, concurrency_levels, target_qps, num_requests)
+    print(f"Finished LLMGuard PII Load Test!")
+    return results
+
+
+def load_test_toxicity(dataset: str, split: str, max_split_size: int, subset: str, threshold: float,
+                       concurrency_levels: list[int], target_qps: float = None, num_requests: int = None,
+                       reuse_scanner: bool = False) -> list[LoadTestResult]:
+    from .input_scanners.toxicity import build_scanner
+    
+    print(f"Preparing dataset for Toxicity Load Test...")
     dataset = load_dataset(dataset, split, subset)
-    dataset = dataset.select(range(min(len(dataset), max_split_size)))
-    print(f"Running LLMGuard PII Evaluation...")
+    dataset = select_samples(dataset, max_split_size)
+    prompts = [example["text"] for example in dataset]
     
-    metrics: EvaluationMetrics = evaluate_toxicity(dataset, threshold)
-    print(f"Finished LLMGuard PII Evaluation!")
-    return metrics
\ No newline at end of file
+    scanner, _ = get_scanner(("llmguard_toxicity", threshold), lambda: build_scanner(threshold), reuse_scanner)
+    scanner.scan(WARMUP_TEXT)
+    print(f"Running LLMGuard Toxicity Load Test...")
+    
+    results = run_load_tests("llmguard_toxicity", scanner.scan, prompts, concurrency_levels, target_qps, num_requests)
+    print(f"Finished LLMGuard Toxicity Load Test!")
+    return results
+
+
+def scale_pii(dataset: str, split: str, max_split_size: int, preferred_language: str, entities: list[str],
+              sizes: list[int] = DEFAULT_SIZES, variants: int = 3, repeats: int = 3,
+              reuse_scanner: bool = False) -> ScalingResult:
+    from .input_scanners.pii import build_scanner
+    
+    print(f"Preparing inputs for PII Scaling...")
+    dataset = load_dataset(dataset, split)
+    dataset = select_samples(dataset, max_split_size, preferred_language)
+    inputs = build_length_inputs([example["source_text"] for example in dataset], sizes, variants)
+    
+    scanner, _ = get_scanner(("llmguard_pii", tuple(sorted(entities))), lambda: build_scanner(entities), reuse_scanner)
+    print(f"Running LLMGuard PII Scaling...")
+    
+    result = run_scaling("llmguard_pii", scanner.scan, inputs, repeats)
+    print(f"Finished LLMGuard PII Scaling!")
+    return result
+
+
+def scale_toxicity(dataset: str, split: str, max_split_size: int, subset: str, threshold: float,
+                   sizes: list[int] = DEFAULT_SIZES, variants: int = 3, repeats: int = 3,
+                   reuse_scanner: bool = False) -> ScalingResult:
+    from .input_scanners.toxicity import build_scanner
+    
+    print(f"Preparing inputs for Toxicity Scaling...")
+    dataset = load_dataset(dataset, split, subset)
+    dataset = select_samples(dataset, max_split_size)
+    inputs = build_length_inputs([example["text"] for example in dataset], sizes, variants)
+    
+    scanner, _ = get_scanner(("llmguard_toxicity", threshold), lambda: build_scanner(threshold), reuse_scanner)
+    print(f"Running LLMGuard Toxicity Scaling...")
+    
+    result = run_scaling("llmguard_toxicity", scanner.scan, inputs, repeats)
+    print(f"Finished LLMGuard Toxicity Scaling!")
+    return result
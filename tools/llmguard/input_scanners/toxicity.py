@@ -1,80 +1,301 @@
 from llm_guard.input_scanners import Toxicity
 from llm_guard.input_scanners.base import Scanner
-from llm_guard.input_scanners.toxicity import MatchType
-from llm_guard.util import configure_logger
+from llm_guard.input_scanners.toxicity import DEFAULT_MODEL, MatchType, _toxic_labels
+from llm_guard.util import calculate_risk_score, configure_logger
 
 from datasets import Dataset
 from datetime import datetime
+from itertools import islice
 import json
-from typing import Dict, List, Any
+import time
+from typing import Dict, List, Any, Tuple
 
+from common.batching import estimate_tokens, scan_bucketed
+from common.cache import PredictionCache
+from common.checkpoint import Checkpoint, restore_checkpoint
 from common.metrics import EvaluationMetrics
+from common.quantization import model_weight_bytes, quantize_models
+from common.scanners import WARMUP_TEXT, prepare_scanner, resident_memory
+from utils.datasets import dataset_length, report_progress, skip_samples
 
 configure_logger(log_level="ERROR", render_json=True)
 
-def evaluate_toxicity(dataset: Dataset, threshold: float) -> EvaluationMetrics:
+def build_scanner(threshold: float, use_onnx: bool = False, quantize: bool = False) -> Toxicity:
+    """
+    Build the LLM Guard Toxicity scanner, matching sentence by sentence.
+    
+    With use_onnx the classifier runs on ONNX Runtime, with quantize it is an int8 dynamically
+    quantized copy of the PyTorch model.
+    """
+    if use_onnx and quantize:
+        raise ValueError("Dynamic quantization only applies to the PyTorch backend")
+    scanner = Toxicity(threshold=threshold, match_type=MatchType.SENTENCE, use_onnx=use_onnx)
+    if quantize:
+        quantize_models(scanner._pipeline)
+    return scanner
+
+
+def scan_batch(scanner: Toxicity, texts: List[str], batch_size: int, return_scores: bool = False) -> List[Tuple]:
+    """
+    Run the Toxicity scanner on several texts with a single batched classifier call.
+
+    Mirrors `Toxicity.scan` so each returned (sanitized_text, is_valid, risk_score)
+    tuple is identical to the one a per-text call would give.
+
+    Args:
+        scanner: The LLM Guard Toxicity scanner
+        texts: Texts to scan
+        batch_size: Batch size given to the underlying transformers pipeline
+        return_scores: Also return the raw highest toxic label score of each text
+
+    Returns:
+        One (sanitized_text, is_valid, risk_score) tuple per input text,
+        with the raw score appended when return_scores is set
+    """
+    # Split every non empty text into its classifier inputs (sentences or full text)
+    inputs = []
+    owners = []
+    for text_idx, text in enumerate(texts):
+        if text.strip() == "":
+            continue
+        text_inputs = scanner._match_type.get_inputs(text)
+        inputs.extend(text_inputs)
+        owners.extend([text_idx] * len(text_inputs))
+
+    predictions = scanner._pipeline(inputs, batch_size=batch_size) if inputs else []
+
+    # Group predictions back per text, keeping the original sentence order
+    results_per_text: List[List[Any]] = [[] for _ in texts]
+    for text_idx, prediction in zip(owners, predictions):
+        results_per_text[text_idx].append(prediction)
+
+    scan_results = []
+    for text, results_all in zip(texts, results_per_text):
+        if text.strip() == "":
+            scan_results.append((text, True, -1.0, 0.0) if return_scores else (text, True, -1.0))
+            continue
+
+        # The scanner stops at the first toxic label above the threshold, the raw score is the highest one
+        highest_toxicity_score = 0.0
+        toxic_result = None
+        for results_chunk in results_all:
+            for result in results_chunk:
+                if result["label"] not in _toxic_labels:
+                    continue
+                if toxic_result is None and result["score"] > scanner._threshold:
+                    toxic_result = result
+                highest_toxicity_score = max(highest_toxicity_score, result["score"])
+
+        if toxic_result is not None:
+            scan_result = (text, False, calculate_risk_score(toxic_result["score"], scanner._threshold))
+        else:
+            scan_result = (text, True, calculate_risk_score(highest_toxicity_score, scanner._threshold))
+        scan_results.append(scan_result + (highest_toxicity_score,) if return_scores else scan_result)
+
+    return scan_results
+
+
+def check_scan_batch(scanner: Toxicity, texts: List[str]):
+    """
+    Check that scan_batch still gives the result of `Toxicity.scan` on sample texts.
+
+    scan_batch mirrors the scanner with its private attributes, so an llm_guard release changing
+    the scoring would otherwise silently change the batched results. A single text batch runs the
+    classifier exactly like the scanner does, so the results must be identical.
+
+    Raises:
+        RuntimeError: When a batched result differs from the scanner's
+    """
+    for text in texts:
+        expected = tuple(scanner.scan(text))
+        batched = scan_batch(scanner, [text], 1)[0]
+        if batched != expected:
+            raise RuntimeError(
+                f"Batched Toxicity scan {batched} differs from Toxicity.scan {expected} on {text!r}, "
+                f"scan_batch no longer matches the installed llm_guard version"
+            )
+
+
+def _score_example(metrics: EvaluationMetrics, text: str, ground_truth_toxic: bool,
+                   sanitized_text: str, is_valid: bool, risk_score: float):
+    """Compare a scan result with the ground truth and update the metrics"""
+    metrics.increment_evaluated_prompts()
+
+    # Determine if LLM Guard detected toxicity (not valid or sanitized)
+    llm_guard_detected_toxic = not is_valid or sanitized_text != text
+    metrics.record_prediction(llm_guard_detected_toxic, bool(ground_truth_toxic))
+
+    # Compare LLM Guard detection with ground truth
+    if ground_truth_toxic and llm_guard_detected_toxic:
+        # True Positive: Text is toxic and detected as toxic
+        metrics.increment_statistic("tp", details={
+            "text": text,
+            "risk_score": risk_score,
+            "sanitized": sanitized_text
+        })
+    elif ground_truth_toxic and not llm_guard_detected_toxic:
+        # False Negative: Text is toxic but not detected as toxic
+        metrics.increment_statistic("fn", details={
+            "text": text,
+            "risk_score": risk_score,
+            "sanitized": sanitized_text
+        })
+    elif not ground_truth_toxic and llm_guard_detected_toxic:
+        # False Positive: Text is not toxic but detected as toxic
+        metrics.increment_statistic("fp", details={
+            "text": text,
+            "risk_score": risk_score,
+            "sanitized": sanitized_text
+        })
+    else:  # not ground_truth_toxic and not llm_guard_detected_toxic
+        # True Negative: Text is not toxic and not detected as toxic
+        metrics.increment_statistic("tn", details={
+            "text": text,
+            "risk_score": risk_score
+        })
+
+
+def evaluate_toxicity(dataset: Dataset, threshold: float, batch_size: int = 1, cache: PredictionCache = None,
+                      sweep_thresholds: List[float] = None, max_details: int = None, spill_dir: str = None,
+                      checkpoint: Checkpoint = None, reuse_scanner: bool = False,
+                      use_onnx: bool = False, quantize: bool = False,
+                      max_batch_tokens: int = None, max_batch_size: int = None, window_size: int = 512) -> EvaluationMetrics:
     """
     Evaluate LLMGuard's Toxicity detection capabilities against a ground truth dataset.
     
+    With a token budget, rows are read by windows and the texts of a window are classified by batches
+    of similar length (see common.batching), then scored back in their original order. Batches are
+    planned on whole texts while the classifier pads their sentences, so the reported padding is an
+    upper bound of the real one. Batched runs first check scan_batch against `Toxicity.scan` on a
+    few rows (see check_scan_batch).
+    
     Args:
         dataset: Dataset containing the prompt and ground truth toxicity label
         threshold: Threshold for toxicity detection
-        sample_size: Optional number of samples to evaluate (defaults to entire dataset)
+        batch_size: Number of rows sent to the classifier at once (1 keeps the per-row scan)
+        cache: Optional prediction cache, to reuse the predictions of previous runs
+        sweep_thresholds: Optional thresholds to sweep, recording the raw score of every row
+            so all of them are evaluated from a single run of the model
+        max_details: Optional maximum number of details kept in memory per category
+        spill_dir: Optional directory where the details beyond max_details are written as JSONL
+        checkpoint: Optional checkpoint, to save the progress periodically and resume an interrupted run
+        reuse_scanner: Reuse the scanner built by a previous evaluation in this process
+        use_onnx: Run the model with ONNX Runtime instead of PyTorch
+        quantize: Run an int8 dynamically quantized copy of the PyTorch model
+        max_batch_tokens: Optional maximum padded tokens of a classifier batch, replacing batch_size
+        max_batch_size: Optional maximum number of texts of a classifier batch
+        window_size: Number of rows bucketed together by length when batching by tokens
         
     Returns:
         An EvaluationMetrics object with the evaluation results
     """
-    # Initialize components
-    metrics = EvaluationMetrics("llmguard_toxicity")
-    scanner = Toxicity(threshold=threshold, match_type=MatchType.SENTENCE)
+    if batch_size < 1:
+        raise ValueError(f"Invalid batch size: {batch_size}")
+    if max_batch_tokens is not None and batch_size > 1:
+        raise ValueError("batch_size and max_batch_tokens are exclusive, the token budget sizes the batches")
 
-    total_samples = len(dataset)
+    # Initialize components, each backend having its own label (and so scanner and cache keys)
+    label = "llmguard_toxicity" + ("_onnx" if use_onnx else "") + ("_int8" if quantize else "")
+    metrics = EvaluationMetrics(label, max_details=max_details, spill_dir=spill_dir)
     
-    # Process each example in the dataset
-    for idx, example in enumerate(dataset):
-        if idx % 100 == 0:
-            print(f"Processing {idx}/{total_samples} samples ({int(idx/total_samples*100)}%)")
-        
-        text = example["text"]
-        ground_truth_toxic = example["toxicity"]  # Assuming this is a boolean or threshold value
-        
-        # Process example with LLM Guard scanner
-        sanitized_text, is_valid, risk_score = scanner.scan(text)
-        metrics.increment_evaluated_prompts()
-        
-        # Determine if LLM Guard detected toxicity (not valid or sanitized)
-        llm_guard_detected_toxic = not is_valid or sanitized_text != text
-        
-        # Compare LLM Guard detection with ground truth
-        if ground_truth_toxic and llm_guard_detected_toxic:
-            # True Positive: Text is toxic and detected as toxic
-            metrics.increment_statistic("tp", details={
-                "text": text,
-                "risk_score": risk_score,
-                "sanitized": sanitized_text
-            })
-        elif ground_truth_toxic and not llm_guard_detected_toxic:
-            # False Negative: Text is toxic but not detected as toxic
-            metrics.increment_statistic("fn", details={
-                "text": text,
-                "risk_score": risk_score,
-                "sanitized": sanitized_text
-            })
-        elif not ground_truth_toxic and llm_guard_detected_toxic:
-            # False Positive: Text is not toxic but detected as toxic
-            metrics.increment_statistic("fp", details={
-                "text": text,
-                "risk_score": risk_score,
-                "sanitized": sanitized_text
-            })
-        else:  # not ground_truth_toxic and not llm_guard_detected_toxic
-            # True Negative: Text is not toxic and not detected as toxic
-            metrics.increment_statistic("tn", details={
-                "text": text,
-                "risk_score": risk_score
-            })
+    # Restore the partial metrics of an interrupted run
+    start_position, metrics, finished = restore_checkpoint(checkpoint, metrics)
+    if finished:
+        return metrics
+
+    record_scores = sweep_thresholds is not None
+    if record_scores:
+        metrics.sweep_thresholds = sorted(sweep_thresholds)
+    scanner = prepare_scanner(
+        metrics, (label, threshold), lambda: build_scanner(threshold, use_onnx, quantize),
+        lambda scanner, text: scanner.scan(text), reuse_scanner
+    )
+    metrics.model_weights = model_weight_bytes(scanner._pipeline)
+    cache_namespace = PredictionCache.namespace(label, {
+        "scanner": "Toxicity",
+        "model": DEFAULT_MODEL.path,
+        "threshold": threshold,
+        "match_type": MatchType.SENTENCE.value,
+        "raw_score": record_scores
+    })
+
+    # The batched path is checked against the scanner on the first rows, once per run
+    check_batched = batch_size > 1 or record_scores or max_batch_tokens is not None
+
+    total_samples = dataset_length(dataset)
+    
+    # Process the dataset by batches of rows, or by windows of rows bucketed by length
+    read_size = window_size if max_batch_tokens is not None else batch_size
+    rows = iter(skip_samples(dataset, start_position))
+    idx = start_position
+    while True:
+        if checkpoint is not None:
+            checkpoint.update(idx, metrics)
+
+        batch = list(islice(rows, read_size))
+        if not batch:
+            break
+
+        # Report progress whenever the batch covers a multiple of 100 rows
+        if idx % 100 == 0 or idx % 100 + len(batch) > 100:
+            report_progress(idx, total_samples)
+
+        texts = [example["text"] for example in batch]
+        if check_batched:
+            check_scan_batch(scanner, [WARMUP_TEXT, ""] + texts[:8])
+            check_batched = False
+
+        # Look up cached predictions, only the missing texts go through the scanner
+        scan_results = [None] * len(texts)
+        missing = []
+        for text_idx, text in enumerate(texts):
+            if cache is not None:
+                found, value = cache.get(PredictionCache.key(cache_namespace, text))
+                if found:
+                    scan_results[text_idx] = tuple(value)
+                    continue
+            missing.append(text_idx)
+
+        # Process examples with LLM Guard scanner
+        if missing:
+            missing_texts = [texts[text_idx] for text_idx in missing]
+            if max_batch_tokens is not None:
+                missing_results, latencies, tokens, padded_tokens = scan_bucketed(
+                    missing_texts, lambda text: scan_batch(scanner, [text], 1, record_scores)[0],
+                    lambda texts: scan_batch(scanner, texts, len(texts), record_scores),
+                    estimate_tokens, max_batch_tokens, max_batch_size
+                )
+                metrics.record_tokens(tokens, padded_tokens)
+            else:
+                scan_start = time.perf_counter()
+                if batch_size == 1 and not record_scores:
+                    missing_results = [scanner.scan(missing_texts[0])]
+                else:
+                    missing_results = scan_batch(scanner, missing_texts, batch_size, record_scores)
+                # Batched rows share the batch duration evenly
+                latencies = [(time.perf_counter() - scan_start) / len(missing)] * len(missing)
+
+            for text_idx, result, latency in zip(missing, missing_results, latencies):
+                scan_results[text_idx] = result
+                metrics.record_latency(latency)
+                if cache is not None:
+                    cache.set(PredictionCache.key(cache_namespace, texts[text_idx]), list(result))
+
+        for example, scan_result in zip(batch, scan_results):
+            sanitized_text, is_valid, risk_score = scan_result[:3]
+            ground_truth_toxic = example["toxicity"]  # Assuming this is a boolean or threshold value
+            if record_scores:
+                metrics.record_score(scan_result[3], bool(ground_truth_toxic))
+            _score_example(metrics, example["text"], ground_truth_toxic, sanitized_text, is_valid, risk_score)
+
+        idx += len(batch)
     
     # Set end time for evaluation duration calculation
     metrics.end_date = datetime.now()
+    metrics.resident_memory = resident_memory()
+    if checkpoint is not None:
+        checkpoint.save(idx, metrics, finished=True)
+    if cache is not None:
+        print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
     
-    return metrics
\ No newline at end of file
+    return metrics
@@ -1,12 +1,27 @@
 # pii_utils.py
 
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
 from faker import Faker
 
 fake = Faker('fr_FR')
 
-def sample_pii():
+# Entity types of the generated values
+PII_LABELS = ["PERSON", "PHONE_NUMBER", "EMAIL_ADDRESS", "CREDIT_CARD", "IBAN_CODE", "IP_ADDRESS", "LOCATION", "DATE_TIME"]
+
+# Fixed date range of the pools, a range relative to today would change the values from one day to the next
+POOL_DATE_RANGE = (datetime(2024, 1, 1), datetime(2025, 1, 1))
+
+# Values generated per pool chunk, each chunk has its own seed so pools don't depend on the number of workers
+POOL_CHUNK_SIZE = 10000
+
+def _pii_values(fake: Faker, start_date='-1y', end_date='now'):
     """
-    Returns a dict mapping each label to a French-formatted fake value.
+    Returns a dict mapping each label to a fake value of the Faker locale.
     """
     return {
         "PERSON":        fake.name(),
@@ -16,27 +31,149 @@ def sample_pii():
         "IBAN_CODE":     fake.iban(),
         "IP_ADDRESS":    fake.ipv4(),
         "LOCATION":      fake.address().replace("\n", ", "),
-        "DATE_TIME":     fake.date_time_between(start_date='-1y', end_date='now')
+        "DATE_TIME":     fake.date_time_between(start_date=start_date, end_date=end_date)
                               .strftime("%d/%m/%Y %H:%M:%S"),
     }
 
+def sample_pii():
+    """
+    Returns a dict mapping each label to a French-formatted fake value.
+    """
+    return _pii_values(fake)
+
+def _generate_chunk(locale: str, seed: int, chunk: int, size: int):
+    """
+    Generates one chunk of a pool: `size` values per label, from a Faker seeded
+    by the pool seed, the locale and the chunk index.
+    """
+    chunk_fake = Faker(locale)
+    chunk_fake.seed_instance(zlib.crc32(f"{seed}:{locale}:{chunk}".encode("utf-8")))
+    columns = {label: [] for label in PII_LABELS}
+    for _ in range(size):
+        for label, val in _pii_values(chunk_fake, *POOL_DATE_RANGE).items():
+            columns[label].append(val)
+    return columns
+
+
+class PIIPools:
+    """
+    Pools of pre-generated fake values per locale and label, sampled by index arrays.
+
+    The values only depend on the seed, the locales and the pool size, so a seed always
+    rebuilds the same pools, and sampling them with a seeded generator the same records.
+    """
+
+    def __init__(self, size: int, locales=("fr_FR",), seed: int = 0, num_proc: int = None):
+        """
+        Generates the pools.
+
+        :param size: Number of values per locale and label
+        :param locales: Faker locales of the values
+        :param seed: Seed of the generation
+        :param num_proc: Optional number of worker processes generating the chunks
+        """
+        self.size = size
+        self.locales = list(locales)
+        self.seed = seed
+
+        tasks = [
+            (locale, seed, chunk, min(POOL_CHUNK_SIZE, size - chunk * POOL_CHUNK_SIZE))
+            for locale in self.locales
+            for chunk in range((size + POOL_CHUNK_SIZE - 1) // POOL_CHUNK_SIZE)
+        ]
+        if num_proc is not None and num_proc > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(num_proc, len(tasks))) as executor:
+                chunks = list(executor.map(_generate_chunk, *zip(*tasks)))
+        else:
+            chunks = [_generate_chunk(*task) for task in tasks]
+
+        # Chunks are in task order, so each label gets its values back locale by locale, chunk by chunk:
+        # the values of the i-th locale are at [i * size, (i + 1) * size) of the label pool
+        self.values = {
+            label: np.array([val for columns in chunks for val in columns[label]], dtype=object)
+            for label in PII_LABELS
+        }
+
+    def sample_indices(self, n: int, rng: np.random.Generator = None, locale: str = None):
+        """
+        Draws the pool indices of n records, each label independently.
+
+        Without a locale, each record takes a random locale of the pools.
+
+        :param n: Number of records
+        :param rng: Random generator (defaults to one seeded with the pool seed)
+        :param locale: Optional locale of all the records
+        :return: (locale index of each record, dict mapping each label to indices into self.values[label])
+        """
+        if rng is None:
+            rng = np.random.default_rng(self.seed)
+        if locale is not None and locale not in self.locales:
+            raise ValueError(f"No pool for locale {locale}, expected one of {', '.join(self.locales)}")
+
+        locale_idx = (np.full(n, self.locales.index(locale)) if locale is not None
+                      else rng.integers(0, len(self.locales), n))
+        offsets = locale_idx * self.size
+        return locale_idx, {label: offsets + rng.integers(0, self.size, n) for label in PII_LABELS}
+
+    def sample(self, n: int, rng: np.random.Generator = None, locale: str = None):
+        """
+        Samples n records, as one array of values per label plus a "locale" array.
+
+        :param n: Number of records
+        :param rng: Random generator (defaults to one seeded with the pool seed)
+        :param locale: Optional locale of all the records
+        :return: Dict mapping each label, and "locale", to an array of n values
+        """
+        locale_idx, indices = self.sample_indices(n, rng, locale)
+        columns = {label: self.values[label][indices[label]] for label in PII_LABELS}
+        columns["locale"] = np.array(self.locales, dtype=object)[locale_idx]
+        return columns
+
+    def sample_records(self, n: int, rng: np.random.Generator = None, locale: str = None):
+        """
+        Samples n records as sample_pii dicts (with their "locale" apart).
+
+        :return: List of (pii values, locale) tuples
+        """
+        columns = self.sample(n, rng, locale)
+        return [
+            ({label: columns[label][idx] for label in PII_LABELS}, columns["locale"][idx])
+            for idx in range(n)
+        ]
+
 def mask_entities(raw_text: str, pii_values: dict):
     """
     Given raw_text where placeholders [LABEL] have been replaced by real values,
     returns (masked_text, mappings) where masked_text has <LABEL> tags and
-    mappings is a list of {type, span, raw}.
+    mappings is a list of {type, span, raw}, one per occurrence in text order.
+
+    All values are matched in a single left-to-right pass of one alternation regex,
+    longest value first, so spans are offsets in raw_text and a value contained in a
+    longer one is not masked inside it.
     """
-    masked = raw_text
-    mappings = []
+    # Value -> label, the first label wins when two labels share a value
+    labels = {}
     for label, val in pii_values.items():
-        start = raw_text.find(val)
-        if start == -1:
-            continue
-        end = start + len(val)
+        if val:
+            labels.setdefault(val, label)
+    if not labels:
+        return raw_text, []
+
+    pattern = re.compile("|".join(re.escape(val) for val in sorted(labels, key=len, reverse=True)))
+
+    parts = []
+    mappings = []
+    last = 0
+    for match in pattern.finditer(raw_text):
+        start, end = match.span()
+        label = labels[match.group()]
+        parts.append(raw_text[last:start])
+        parts.append(f"<{label}>")
         mappings.append({
             "type":  label,
             "span":  (start, end),
-            "raw":   val
+            "raw":   match.group()
         })
-        masked = masked.replace(val, f"<{label}>")
-    return masked, mappings
+        last = end
+    parts.append(raw_text[last:])
+    return "".join(parts), mappings
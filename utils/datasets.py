@@ -1,15 +1,70 @@
+import json
+from typing import Any, List, Optional, Union
+
 import datasets
 
-def load_dataset(name: str, split: str, subset: str = ""):
-    """Load a dataset from hugging face"""
+def load_dataset(name: str, split: str, subset: str = "", streaming: bool = False):
+    """Load a dataset from hugging face (as an iterable dataset when streaming)"""
     if subset != "":
-        dataset = datasets.load_dataset(name, subset, split=split)
+        dataset = datasets.load_dataset(name, subset, split=split, streaming=streaming)
+    else:
+        dataset = datasets.load_dataset(name, split=split, streaming=streaming)
+    if streaming:
+        print(f"Split '{split}' from '{name}' opened in streaming mode !")
     else:
-        dataset = datasets.load_dataset(name, split=split)
-    print(f"Split '{split}' of size {len(dataset)} from '{name}' loaded !")
+        print(f"Split '{split}' of size {len(dataset)} from '{name}' loaded !")
     return dataset
 
 
+def _has_language(languages: List[str], language: str) -> List[bool]:
+    """Batched filter keeping the rows of a given language"""
+    return [row_language == language for row_language in languages]
+
+
+def select_samples(dataset: Union[datasets.Dataset, datasets.IterableDataset], max_split_size: int, language: str = "",
+                   num_proc: int = None):
+    """
+    Keep the first `max_split_size` rows of a dataset, optionally only those of a given language.
+    
+    Iterable (streaming) datasets are filtered lazily and stop after `max_split_size` matches,
+    so only the rows needed are ever downloaded and decoded. The language filter reads the
+    language column only, by batches (and with `num_proc` processes for map-style datasets).
+    """
+    filter_kwargs = dict(batched=True, input_columns=["language"], fn_kwargs={"language": language})
+    if isinstance(dataset, datasets.IterableDataset):
+        if language != "":
+            dataset = dataset.filter(_has_language, **filter_kwargs)
+        return dataset.take(max_split_size)
+    
+    if language != "":
+        dataset = dataset.filter(_has_language, num_proc=num_proc, **filter_kwargs)
+    return dataset.select(range(min(len(dataset), max_split_size)))
+
+
+def skip_samples(dataset: Union[datasets.Dataset, datasets.IterableDataset], count: int):
+    """Skip the first `count` rows of a dataset"""
+    if count == 0:
+        return dataset
+    if isinstance(dataset, datasets.IterableDataset):
+        return dataset.skip(count)
+    return dataset.select(range(min(count, len(dataset)), len(dataset)))
+
+
+def dataset_length(dataset: Union[datasets.Dataset, datasets.IterableDataset]) -> Optional[int]:
+    """Return the number of rows of a dataset, or None when it is streamed"""
+    if isinstance(dataset, datasets.IterableDataset):
+        return None
+    return len(dataset)
+
+
+def report_progress(idx: int, total_samples: Optional[int]):
+    """Print the evaluation progress (total_samples is None for streamed datasets)"""
+    if total_samples:
+        print(f"Processing {idx}/{total_samples} samples ({int(idx/total_samples*100)}%)")
+    else:
+        print(f"Processing {idx} samples")
+
+
 def get_ai4privacy_to_presidio_mapping(presidio_entities: list[str] = []):
     mapping = {
         "EMAIL": "EMAIL_ADDRESS",
@@ -32,4 +87,81 @@ def get_ai4privacy_to_presidio_mapping(presidio_entities: list[str] = []):
         return mapping
     
     filtered_mapping = {key: value for key, value in mapping.items() if value in presidio_entities}
-    return filtered_mapping
\ No newline at end of file
+    return filtered_mapping
+
+
+def decode_privacy_masks(privacy_mask: Any) -> Optional[List[dict]]:
+    """
+    Decode the privacy_mask column of an ai4privacy example.
+
+    Args:
+        privacy_mask: The masks, as a JSON string or an already decoded list
+
+    Returns:
+        The list of masks (label, start, end, value), or None when the column is malformed
+    """
+    try:
+        return json.loads(privacy_mask) if isinstance(privacy_mask, str) else privacy_mask
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def _parse_privacy_masks(privacy_mask_batch: List[Any], entity_mapping: dict) -> dict:
+    """Batched map decoding the privacy masks and mapping their labels to Presidio types"""
+    parsed_batch = []
+    has_relevant_entity_batch = []
+    for privacy_mask in privacy_mask_batch:
+        masks = decode_privacy_masks(privacy_mask)
+        if masks is None:
+            # Malformed rows are kept (so positions don't move) and skipped by the evaluators
+            parsed_batch.append(None)
+            has_relevant_entity_batch.append(False)
+            continue
+        # Same keys on every mask, so that all the batches share one Arrow schema
+        parsed = [
+            {
+                "label": mask["label"],
+                "start": mask["start"],
+                "end": mask["end"],
+                "value": mask["value"],
+                "presidio_type": entity_mapping.get(mask["label"])
+            }
+            for mask in masks
+        ]
+        parsed_batch.append(parsed)
+        has_relevant_entity_batch.append(any(mask["presidio_type"] is not None for mask in parsed))
+    return {"privacy_masks": parsed_batch, "has_relevant_entity": has_relevant_entity_batch}
+
+
+def prepare_ai4privacy(dataset: Union[datasets.Dataset, datasets.IterableDataset], presidio_entities: list[str],
+                       num_proc: int = None, batch_size: int = 1000):
+    """
+    Precompute the columns the PII evaluators score from, once per dataset and entity types.
+    
+    Adds a `privacy_masks` column (the decoded masks, each with its `presidio_type`, None when
+    the label isn't evaluated) and a `has_relevant_entity` column. The map is batched and, for
+    map-style datasets, persisted in the Hugging Face cache, so later runs reuse the parsed
+    columns instead of decoding JSON in the evaluation loop. Streamed datasets are mapped lazily.
+    """
+    map_kwargs = dict(
+        batched=True,
+        batch_size=batch_size,
+        input_columns=["privacy_mask"],
+        fn_kwargs={"entity_mapping": get_ai4privacy_to_presidio_mapping(presidio_entities)}
+    )
+    if isinstance(dataset, datasets.IterableDataset):
+        return dataset.map(_parse_privacy_masks, **map_kwargs)
+    
+    # Explicit schema, a batch without any mask would otherwise infer a list of nulls
+    features = dataset.features.copy()
+    features["privacy_masks"] = [{
+        "label": datasets.Value("string"),
+        "start": datasets.Value("int64"),
+        "end": datasets.Value("int64"),
+        "value": datasets.Value("string"),
+        "presidio_type": datasets.Value("string")
+    }]
+    features["has_relevant_entity"] = datasets.Value("bool")
+    return dataset.map(
+        _parse_privacy_masks, num_proc=num_proc, features=features, desc="Parsing privacy masks", **map_kwargs
+    )